@@ -1,3 +1,4 @@
+from functools import lru_cache
 from hashlib import sha256, new
 from utility import paddedBytes
 
@@ -32,6 +33,10 @@ def _base58Decode(address):
     return paddedBytes(result, 25)
 
 
+# addresses of recently seen public keys, see encode.cache_info() for hits and misses
+ADDRESS_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def encode(publicKeyBytes):
     hashed = sha256(publicKeyBytes).digest()
 
@@ -41,14 +46,19 @@ def encode(publicKeyBytes):
     hashed = ripemd160.digest()
 
     # add 0x00 as version code for main network
-    hashed = bytes(1) + hashed
+    return encodePayload(bytes(1) + hashed)
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def encodePayload(payload):
+    """address of a 21 byte version + hash160 payload, the inverse of decode"""
 
     # hash twice with sha256
-    checksumHashed = sha256(hashed).digest()
+    checksumHashed = sha256(payload).digest()
     checksumHashed = sha256(checksumHashed).digest()
 
     checksum = checksumHashed[:4]
-    hashed = hashed + checksum
+    hashed = payload + checksum
 
     return _base58Encode(hashed)
 
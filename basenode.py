@@ -0,0 +1,122 @@
+import threading
+from functools import wraps
+
+from ecc import generateKeyPair, compressPublicKey, generateSignature
+from base58check import encode
+from network import INV_BLOCK
+
+from tx import Tx, TxIn, TxOut
+
+# every node lives in this process, background miners deliver blocks from
+# their own threads so message handling across the network is serialized
+networkLock = threading.RLock()
+
+def synchronized(method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with networkLock:
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class BaseNode(object):
+    """keys, peers, messaging and the wallet shared by full and light nodes,
+    subclasses provide blockIndex, unspentOutputs, spendableOutputs and submitTx"""
+
+    def __init__(self, label=None, nodeType="Basic"):
+
+        # Labeling
+        self.nodeType = nodeType
+        self.label = label
+
+        (sk, pk) = generateKeyPair()
+        self.privateKey = sk
+        self.uncompressedPublicKey = pk
+
+        cpk = compressPublicKey(pk)
+        self.publicKey = cpk
+        self.address = encode(cpk)
+
+        self.peers = set()
+
+        # None delivers to peers by direct (recursive) calls
+        self.messageBus = None
+
+
+    def __str__(self):
+        return self.nodeType + " Node: " + (self.label or self.address)
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    @synchronized
+    def addPeer(self, peer):
+        # background miners iterate the peers while relaying
+        self.peers.add(peer)
+
+
+    def setMessageBus(self, messageBus):
+        self.messageBus = messageBus
+
+
+    def sendTo(self, peer, method, payload, kind=INV_BLOCK):
+        """call peer.method(payload), queued on the message bus if there is one,
+        kind is the inventory kind the message is about"""
+
+        if self.messageBus is None:
+            getattr(peer, method)(payload)
+        else:
+            self.messageBus.send(peer, method, payload, kind)
+
+
+    def flushMessages(self):
+        if self.messageBus is not None:
+            self.messageBus.run()
+
+
+    @synchronized
+    def blockHeight(self):
+        """height of the current tip, the genesis block has height 0"""
+        return self.blockIndex.tip.height
+
+
+    # wallet
+
+    @synchronized
+    def spendableAmount(self):
+        result = 0
+
+        for (_, txOut) in self.unspentOutputs():
+            result += txOut.amount
+        return result
+
+
+    @synchronized
+    def transfer(self, amount, address):
+        uTxs = []
+        total = 0
+
+        for (outpoint, txOut) in self.spendableOutputs():
+            total += txOut.amount
+            uTxs.append(outpoint)
+
+            if total >= amount:
+                break
+        else:
+            raise ValueError("Wallet dose not have enough spendable outputs for transfer.")
+
+        txIns = []
+        for (txHash, i) in uTxs:
+            txIn = TxIn(txHash, i)
+            txIn.setScriptSig(generateSignature(txIn.toBytes(), self.privateKey), self.publicKey)
+            txIns.append(txIn)
+
+        txOuts = [TxOut(amount, address)]
+
+        change = total - amount
+        if change > 0:
+            txOuts.append(TxOut(change, self.address))
+
+        self.submitTx(Tx(txIns, txOuts))
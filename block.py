@@ -1,9 +1,123 @@
 from hashlib import sha256
 from tx import Tx, TxReward
+from utility import HashCached
 
-class BlockHeader(object):
+TARGET_SIZE = 256
+TARGET_ZEROS = 8
+
+target_binary = '0' * TARGET_ZEROS + '1' * (TARGET_SIZE - TARGET_ZEROS)
+target = int(target_binary, base=2)
+
+# digests and target are both 32 big endian bytes, so comparing bytes compares values
+targetBytes = target.to_bytes(32, 'big')
+
+def merkleParent(left, right):
+    return sha256(left + right).digest()
+
+
+class MerkleTree(object):
+    """merkle tree keeping every level, so changing or appending a leaf only
+    rehashes the path from that leaf up to the root"""
+
+    def __init__(self, hashes):
+        if len(hashes) == 0:
+            raise ValueError("A merkle tree requires at least one leaf.")
+
+        self.levels = [list(hashes)]
+
+        while len(self.levels[-1]) > 1:
+            currentList = self.levels[-1]
+            tempList = []
+
+            for i in range(0, len(currentList), 2):
+                # if odd number of elements the last element is hashed with itself
+                right = currentList[i + 1] if i + 1 < len(currentList) else currentList[i]
+                tempList.append(merkleParent(currentList[i], right))
+
+            self.levels.append(tempList)
+
+
+    def __len__(self):
+        return len(self.levels[0])
+
+
+    def root(self):
+        return self.levels[-1][0]
+
+
+    def append(self, leafHash):
+        self.levels[0].append(leafHash)
+        self.updatePath(len(self.levels[0]) - 1)
+
+
+    def update(self, index, leafHash):
+        self.levels[0][index] = leafHash
+        self.updatePath(index)
+
+
+    def updatePath(self, index):
+        level = 0
+
+        while len(self.levels[level]) > 1:
+            nodes = self.levels[level]
+            left = index - index % 2
+            right = left + 1 if left + 1 < len(nodes) else left
+            parent = merkleParent(nodes[left], nodes[right])
+
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+
+            parents = self.levels[level + 1]
+            index //= 2
+            if index == len(parents):
+                parents.append(parent)
+            else:
+                parents[index] = parent
+
+            level += 1
+
+
+    def branch(self, index):
+        """sibling hashes from the leaf at index up to the root, enough to
+        recompute the root from that leaf alone"""
+
+        if not 0 <= index < len(self):
+            raise IndexError("No merkle leaf at index {}.".format(index))
+
+        result = []
+        for nodes in self.levels[:-1]:
+            sibling = index ^ 1
+            # a last odd node is paired with itself
+            result.append(nodes[sibling] if sibling < len(nodes) else nodes[index])
+            index //= 2
+
+        return result
+
+
+def merkleRootFromBranch(leafHash, index, branch):
+    currentHash = leafHash
+
+    for sibling in branch:
+        if index % 2 == 0:
+            currentHash = merkleParent(currentHash, sibling)
+        else:
+            currentHash = merkleParent(sibling, currentHash)
+        index //= 2
+
+    return currentHash
+
+
+def verifyMerkleBranch(leafHash, index, branch, merkleRoot):
+    """whether the leaf at index is committed to by merkleRoot"""
+    return merkleRootFromBranch(leafHash, index, branch) == merkleRoot
+
+
+class BlockHeader(HashCached):
+
+    __slots__ = ('prevBlockHash', 'merkleRoot', 'nonce')
 
     def __init__(self, prevBlockHash, merkleRoot, nonce=None):
+        super(BlockHeader, self).__init__()
         self.prevBlockHash = prevBlockHash
         self.merkleRoot = merkleRoot
         self.nonce = nonce
@@ -13,8 +127,16 @@ class BlockHeader(object):
         self.nonce = nonce.to_bytes(4, 'big')
 
 
+    def _serialize(self):
+        return self.prevBlockHash + self.merkleRoot + self.nonce
+
+
     def blockHash(self):
-        return sha256(self.prevBlockHash + self.merkleRoot + self.nonce).digest()
+        return self.toHash()
+
+
+    def meetsTarget(self):
+        return self.nonce is not None and self.blockHash() <= targetBytes
 
 
 class Block(object):
@@ -36,24 +158,12 @@ class Block(object):
 
 
     def merkleRoot(self):
-        currentList = [tx.toHash() for tx in self.transactions]
-
-        while len(currentList) > 1:
-            tempList = []
+        return MerkleTree([tx.toHash() for tx in self.transactions]).root()
 
-            for i in range(0, len(currentList) // 2 * 2, 2):
-                hashed = sha256(currentList[i] + currentList[i + 1]).digest()
-                tempList.append(hashed)
 
-            if len(currentList) % 2 != 0:
-                # if odd number of elements hash and append last element
-                lastItem = currentList[-1]
-                hashed = sha256(lastItem + lastItem).digest()
-                tempList.append(hashed)
-
-            currentList = tempList
-
-        return currentList[0]
+    def merkleBranch(self, position):
+        """proof that the tx at position is included in this block"""
+        return MerkleTree([tx.toHash() for tx in self.transactions]).branch(position)
 
 
 class UnminedBlock(Block):
@@ -65,6 +175,9 @@ class UnminedBlock(Block):
         self.reward = 50
         self.rewardTransaction = None
 
+        # built once the reward transaction is known, then updated in place
+        self.merkleTree = None
+
 
     def addRewardTransaction(self, address, blockHeight):
         if self.rewardTransaction is not None:
@@ -74,6 +187,36 @@ class UnminedBlock(Block):
         self.rewardTransaction = tx
         self.transactions = [tx] + self.transactions
 
+        self.merkleTree = MerkleTree([tx.toHash() for tx in self.transactions])
+
+
+    def addTransaction(self, tx):
+        self.transactions.append(tx)
+
+        if self.merkleTree is not None:
+            self.merkleTree.append(tx.toHash())
+
+
+    def incrementExtraNonce(self):
+        if self.rewardTransaction is None:
+            raise ValueError("A minable block must contain a reward transaction.")
+
+        # txs are immutable once hashed, replace the reward with a new one
+        reward = self.rewardTransaction
+        tx = TxReward(reward.outputs[0].address, reward.blockHeight, reward.extraNonce + 1)
+        self.rewardTransaction = tx
+        self.transactions[0] = tx
+
+        # the reward transaction is always the first leaf
+        self.merkleTree.update(0, tx.toHash())
+
+
+    def merkleRoot(self):
+        if self.merkleTree is None:
+            return super(UnminedBlock, self).merkleRoot()
+
+        return self.merkleTree.root()
+
 
     def incompleteBlockHeader(self):
         if self.rewardTransaction is None:
@@ -82,6 +225,49 @@ class UnminedBlock(Block):
         return BlockHeader(self.prevBlockHash, self.merkleRoot())
 
 
+# bytes of a short transaction id in compact blocks
+SHORT_ID_SIZE = 6
+
+def shortTxId(blockHash, txHash):
+    """short id of a tx keyed by the block hash, so collisions differ between blocks"""
+    return sha256(blockHash + txHash).digest()[:SHORT_ID_SIZE]
+
+
+class CompactBlock(object):
+    """block header, reward transaction and short ids of the other transactions,
+    receivers rebuild the block from the txs in their mempool"""
+
+    def __init__(self, blockHeader, rewardTransaction, shortIds):
+        self.blockHeader = blockHeader
+        self.rewardTransaction = rewardTransaction
+        self.shortIds = shortIds
+
+
+    @classmethod
+    def fromBlock(cls, block):
+        blockHash = block.blockHeader.blockHash()
+        shortIds = [shortTxId(blockHash, tx.toHash()) for tx in block.transactions[1:]]
+        return cls(block.blockHeader, block.transactions[0], shortIds)
+
+
+    def __str__(self):
+        return "CompactBlock: " + str(self.blockHeader.blockHash().hex())
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def reconstruct(self, transactions):
+        """match the short ids against transactions, returns the block's
+        transaction list with None at every index still missing"""
+
+        blockHash = self.blockHeader.blockHash()
+        lookup = dict((shortTxId(blockHash, tx.toHash()), tx) for tx in transactions)
+
+        return [self.rewardTransaction] + [lookup.get(shortId) for shortId in self.shortIds]
+
+
 class GenesisBlock(Block):
 
     # hardcoded
@@ -0,0 +1,286 @@
+import heapq
+from collections import OrderedDict
+
+from recordlog import RecordLog
+from wire import BLOCK_HEADER_SIZE, writeBlockHeader, readBlockHeader
+
+ORPHAN_POOL_SIZE = 1000
+
+HEADERS_FILE = "headers.dat"
+
+# header log records: operation, then the header or the invalidated block
+# hash zero padded to the same size
+HEADER_ADD = 1
+HEADER_INVALIDATE = 0
+HEADER_RECORD_SIZE = 1 + BLOCK_HEADER_SIZE
+
+# every block is mined against the same fixed target, so each one adds the same work
+BLOCK_WORK = 1
+
+class BlockIndexEntry(object):
+    """only the header is kept, block bodies are looked up in the node's block store"""
+
+    def __init__(self, blockHeader, parent):
+        self.blockHeader = blockHeader
+        self.blockHash = blockHeader.blockHash()
+        self.parent = parent
+        self.children = []
+
+        if parent is None:
+            self.height = 0
+            self.chainWork = BLOCK_WORK
+        else:
+            self.height = parent.height + 1
+            self.chainWork = parent.chainWork + BLOCK_WORK
+
+
+    def __str__(self):
+        return "BlockIndexEntry: {} (height {})".format(self.blockHash.hex(), self.height)
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class BlockIndex(object):
+    """height, parent link and cumulative work of every connected block,
+    the tip is the entry with the most work (first seen wins ties)
+
+    given a path, added and invalidated headers are appended to a log file
+    that is replayed on open, so the index survives restarts without being
+    rewritten"""
+
+    def __init__(self, genesisHeader, path=None):
+        entry = BlockIndexEntry(genesisHeader, None)
+
+        self.entries = {entry.blockHash: entry}
+        self.genesis = entry
+        self.tip = entry
+
+        # (-chainWork, order added, entry) so the top is the best tip, first seen
+        # winning ties. invalidated entries are only dropped once they reach the top
+        self.added = 0
+        self.candidates = [(-entry.chainWork, self.added, entry)]
+
+        # replaying goes through add and invalidate, so the log is only
+        # attached once it has been read
+        self.log = None
+        if path is not None:
+            log = RecordLog(path, HEADER_RECORD_SIZE)
+            self.loadLog(log)
+            self.log = log
+
+
+    def loadLog(self, log):
+        for record in log.records():
+            if record[0] == HEADER_ADD:
+                (header, _) = readBlockHeader(record, 1)
+                self.add(header)
+            else:
+                entry = self.entries.get(bytes(record[1:33]))
+                if entry is not None:
+                    self.invalidate(entry)
+
+
+    def writeLogRecord(self, operation, payload):
+        if self.log is None:
+            return
+
+        record = bytearray((operation,))
+        record += payload
+        record += bytes(HEADER_RECORD_SIZE - len(record))
+        self.log.append(record)
+
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+
+    def __contains__(self, blockHash):
+        return blockHash in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def get(self, blockHash):
+        return self.entries.get(blockHash)
+
+
+    def add(self, blockHeader):
+        """index a block below its parent, returns the new entry or None if the parent is unknown"""
+
+        parent = self.entries.get(blockHeader.prevBlockHash)
+        if parent is None:
+            return None
+
+        if blockHeader.blockHash() in self.entries:
+            return self.entries[blockHeader.blockHash()]
+
+        entry = BlockIndexEntry(blockHeader, parent)
+        self.entries[entry.blockHash] = entry
+        parent.children.append(entry)
+
+        self.added += 1
+        heapq.heappush(self.candidates, (-entry.chainWork, self.added, entry))
+
+        header = bytearray()
+        writeBlockHeader(header, blockHeader)
+        self.writeLogRecord(HEADER_ADD, header)
+
+        if entry.chainWork > self.tip.chainWork:
+            self.tip = entry
+
+        return entry
+
+
+    def findFork(self, entryA, entryB):
+        """last entry both chains have in common"""
+
+        while entryA.height > entryB.height:
+            entryA = entryA.parent
+        while entryB.height > entryA.height:
+            entryB = entryB.parent
+
+        while entryA is not entryB:
+            entryA = entryA.parent
+            entryB = entryB.parent
+
+        return entryA
+
+
+    def invalidate(self, entry):
+        """remove entry and every entry built on top of it, returns the removed entries"""
+
+        if entry.parent is not None:
+            entry.parent.children.remove(entry)
+        self.writeLogRecord(HEADER_INVALIDATE, entry.blockHash)
+
+        removed = []
+        pending = [entry]
+        while pending:
+            candidate = pending.pop()
+            del self.entries[candidate.blockHash]
+            removed.append(candidate)
+            pending.extend(candidate.children)
+
+        # the best remaining candidate becomes the tip
+        while self.entries.get(self.candidates[0][2].blockHash) is not self.candidates[0][2]:
+            heapq.heappop(self.candidates)
+        self.tip = self.candidates[0][2]
+
+        return removed
+
+
+    def chain(self, entry=None):
+        """entries from entry (default the tip) back to genesis"""
+
+        currentEntry = self.tip if entry is None else entry
+        result = []
+
+        while currentEntry is not None:
+            result.append(currentEntry)
+            currentEntry = currentEntry.parent
+
+        return result
+
+
+    def locator(self):
+        """hashes of the best chain from the tip back, dense at first then
+        exponentially spaced, always ending with the genesis block"""
+
+        chain = self.chain()
+        locator = []
+
+        step = 1
+        i = 0
+        while i < len(chain) - 1:
+            locator.append(chain[i].blockHash)
+            if len(locator) >= 10:
+                step *= 2
+            i += step
+
+        locator.append(chain[-1].blockHash)
+        return locator
+
+
+    def headersAfter(self, locator, maxHeaders):
+        """headers of the best chain following the first locator hash we share"""
+
+        chain = self.chain()
+        heights = dict((entry.blockHash, entry.height) for entry in chain)
+
+        start = 0
+        for blockHash in locator:
+            if blockHash in heights:
+                start = heights[blockHash] + 1
+                break
+
+        chain.reverse()
+        return [entry.blockHeader for entry in chain[start:start + maxHeaders]]
+
+
+    def checkHeaders(self, headers):
+        """headers must link up from a known block and each meet the target"""
+
+        if not headers:
+            return True
+
+        if headers[0].prevBlockHash not in self.entries:
+            return False
+
+        prevBlockHash = headers[0].prevBlockHash
+        for header in headers:
+            if header.prevBlockHash != prevBlockHash or not header.meetsTarget():
+                return False
+            prevBlockHash = header.blockHash()
+
+        return True
+
+
+class OrphanPool(object):
+    """blocks whose parent is not known yet, oldest evicted first"""
+
+    def __init__(self, maxSize=ORPHAN_POOL_SIZE):
+        self.maxSize = maxSize
+        self.blocks = OrderedDict() # blockHash -> block
+        self.byParent = {} # prevBlockHash -> set of blockHashes
+
+
+    def __contains__(self, blockHash):
+        return blockHash in self.blocks
+
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+    def add(self, block):
+        blockHash = block.blockHeader.blockHash()
+        if blockHash in self.blocks:
+            return
+
+        self.blocks[blockHash] = block
+        self.byParent.setdefault(block.blockHeader.prevBlockHash, set()).add(blockHash)
+
+        while len(self.blocks) > self.maxSize:
+            self.remove(next(iter(self.blocks)))
+
+
+    def remove(self, blockHash):
+        block = self.blocks.pop(blockHash)
+
+        prevBlockHash = block.blockHeader.prevBlockHash
+        siblings = self.byParent[prevBlockHash]
+        siblings.discard(blockHash)
+        if not siblings:
+            del self.byParent[prevBlockHash]
+
+        return block
+
+
+    def popChildren(self, parentHash):
+        """remove and return the orphans built directly on parentHash"""
+        return [self.remove(blockHash) for blockHash in list(self.byParent.get(parentHash, ()))]
@@ -0,0 +1,94 @@
+# Chainstate snapshots: the utxo set and recent undo records as of a tip,
+# written atomically so a restarted node only has to replay the blocks
+# connected after the snapshot. Headers and the tx index are persisted
+# incrementally by their own logs, so a snapshot's size depends on the
+# current state and not on the length of the chain.
+
+import os
+
+from wire import encodeVarInt, readVarInt, readInt, readBytes, writeTxOut, readTxOut
+
+SNAPSHOT_VERSION = 3
+SNAPSHOT_FILE = "chainstate.dat"
+
+# undo records kept in a snapshot, deeper reorgs rebuild the utxo set from genesis
+SNAPSHOT_UNDO_DEPTH = 100
+
+
+class Snapshot(object):
+
+    def __init__(self, tipHash, utxos, undoData):
+        self.tipHash = tipHash
+        self.utxos = utxos # list of (outpoint, txOut)
+        self.undoData = undoData # blockHash -> undo record
+
+
+def _writeOutput(out, outpoint, txOut):
+    (txHash, i) = outpoint
+    out += txHash
+    out += encodeVarInt(i)
+    writeTxOut(out, txOut)
+
+
+def _readOutput(view, offset):
+    (txHash, offset) = readBytes(view, offset, 32)
+    (i, offset) = readVarInt(view, offset)
+    (txOut, offset) = readTxOut(view, offset)
+    return (((txHash, i), txOut), offset)
+
+
+def writeSnapshot(path, snapshot):
+    out = bytearray((SNAPSHOT_VERSION,))
+    out += snapshot.tipHash
+
+    out += encodeVarInt(len(snapshot.utxos))
+    for (outpoint, txOut) in snapshot.utxos:
+        _writeOutput(out, outpoint, txOut)
+
+    out += encodeVarInt(len(snapshot.undoData))
+    for (blockHash, undo) in snapshot.undoData.items():
+        out += blockHash
+        out += encodeVarInt(len(undo))
+        for (outpoint, txOut) in undo:
+            _writeOutput(out, outpoint, txOut)
+
+    # readers see either the old snapshot or the complete new one
+    tempPath = path + ".tmp"
+    with open(tempPath, "wb") as f:
+        f.write(out)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tempPath, path)
+
+
+def readSnapshot(path):
+    with open(path, "rb") as f:
+        view = memoryview(f.read())
+
+    (version, offset) = readInt(view, 0, 1)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported snapshot version {}.".format(version))
+
+    (tipHash, offset) = readBytes(view, offset, 32)
+
+    (count, offset) = readVarInt(view, offset)
+    utxos = []
+    for _ in range(count):
+        (utxo, offset) = _readOutput(view, offset)
+        utxos.append(utxo)
+
+    (count, offset) = readVarInt(view, offset)
+    undoData = {}
+    for _ in range(count):
+        (blockHash, offset) = readBytes(view, offset, 32)
+        (size, offset) = readVarInt(view, offset)
+        undo = []
+        for _ in range(size):
+            (spent, offset) = _readOutput(view, offset)
+            undo.append(spent)
+        undoData[blockHash] = undo
+
+    if offset != len(view):
+        raise ValueError("Unexpected trailing bytes in snapshot.")
+
+    return Snapshot(tipHash, utxos, undoData)
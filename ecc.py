@@ -18,6 +18,23 @@ def modinv(a,n=Pcurve): #Extended Euclidean Algorithm/'division' in elliptic cur
         lm, low, hm, high = nm, new, lm, low
     return lm % n
 
+def batchModinv(values, n=Pcurve):
+    """inverse of every non zero value using a single modinv (Montgomery's trick)"""
+
+    prefix = []
+    acc = 1
+    for v in values:
+        prefix.append(acc)
+        acc = (acc * v) % n
+
+    accInv = modinv(acc, n)
+    result = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        result[i] = (accInv * prefix[i]) % n
+        accInv = (accInv * values[i]) % n
+
+    return result
+
 def EccAdd(a,b): # Not true addition, invented for EC. Could have been called anything.
     LamAdd = ((b[1]-a[1]) * modinv(b[0]-a[0],Pcurve)) % Pcurve
     x = (LamAdd*LamAdd-a[0]-b[0]) % Pcurve
@@ -32,21 +49,389 @@ def EccDouble(a): # This is called point doubling, also invented for EC.
 
 def EccMultiply(GenPoint,ScalarHex): #Double & add. Not true multiplication
     if ScalarHex == 0 or ScalarHex >= N: raise Exception("Invalid Scalar/Private Key")
-    ScalarBin = str(bin(ScalarHex))[2:]
-    Q=GenPoint
-    for i in range (1, len(ScalarBin)): # This is invented EC multiplication.
-        Q=EccDouble(Q); # print "DUB", Q[0]; print
-        if ScalarBin[i] == "1":
-            Q=EccAdd(Q,GenPoint); # print "ADD", Q[0]; print
-    return (Q)
+    if GenPoint == GPoint:
+        return fromJacobian(generatorMultiply(ScalarHex))
+    return fromJacobian(glvMultiply(toJacobian(GenPoint), ScalarHex))
+
+
+# Jacobian coordinates: (X, Y, Z) represents the affine point (X/Z^2, Y/Z^3).
+# Adding and doubling need no modular inversion, so a whole scalar multiply
+# only pays for a single modinv when converting the result back to affine.
+
+JacobianInfinity = (0, 1, 0) # Z == 0 is the point at infinity
+
+def toJacobian(a):
+    return (a[0], a[1], 1)
+
+
+def fromJacobian(p):
+    if p[2] == 0:
+        raise ValueError("Point at infinity has no affine coordinates.")
+
+    zInv = modinv(p[2], Pcurve)
+    zInv2 = (zInv * zInv) % Pcurve
+    return ((p[0] * zInv2) % Pcurve, (p[1] * zInv2 * zInv) % Pcurve)
+
+
+def jacobianDouble(p):
+    (X, Y, Z) = p
+    if Z == 0 or Y == 0:
+        return JacobianInfinity
+
+    YY = (Y * Y) % Pcurve
+    S = (4 * X * YY) % Pcurve
+    M = (3 * X * X + Acurve * pow(Z, 4, Pcurve)) % Pcurve
+
+    X3 = (M * M - 2 * S) % Pcurve
+    Y3 = (M * (S - X3) - 8 * YY * YY) % Pcurve
+    Z3 = (2 * Y * Z) % Pcurve
+    return (X3, Y3, Z3)
+
+
+def jacobianAdd(p, q):
+    if p[2] == 0:
+        return q
+    if q[2] == 0:
+        return p
+
+    (X1, Y1, Z1) = p
+    (X2, Y2, Z2) = q
+
+    Z1Z1 = (Z1 * Z1) % Pcurve
+    U2 = (X2 * Z1Z1) % Pcurve
+    S2 = (Y2 * Z1 * Z1Z1) % Pcurve
+
+    if Z2 == 1: # mixed addition, q is an affine point
+        U1 = X1
+        S1 = Y1
+    else:
+        Z2Z2 = (Z2 * Z2) % Pcurve
+        U1 = (X1 * Z2Z2) % Pcurve
+        S1 = (Y1 * Z2 * Z2Z2) % Pcurve
+
+    if U1 == U2:
+        if S1 != S2:
+            return JacobianInfinity # p == -q
+        return jacobianDouble(p)
+
+    H = (U2 - U1) % Pcurve
+    R = (S2 - S1) % Pcurve
+    HH = (H * H) % Pcurve
+    HHH = (H * HH) % Pcurve
+    V = (U1 * HH) % Pcurve
+
+    X3 = (R * R - HHH - 2 * V) % Pcurve
+    Y3 = (R * (V - X3) - S1 * HHH) % Pcurve
+    Z3 = (Z1 * Z2 * H) % Pcurve if Z2 != 1 else (Z1 * H) % Pcurve
+    return (X3, Y3, Z3)
+
+
+def jacobianMultiply(p, scalar):
+    """left to right double and add, p and the result are jacobian points"""
+
+    Q = JacobianInfinity
+    for bit in bin(scalar)[2:]:
+        Q = jacobianDouble(Q)
+        if bit == "1":
+            Q = jacobianAdd(Q, p)
+    return Q
+
+
+def jacobianNegate(p):
+    return (p[0], (-p[1]) % Pcurve, p[2])
+
+
+# Interleaved (Strauss-Shamir) multi scalar multiplication. Each scalar is
+# recoded into width-w NAF digits, so at most one in w+1 digits is non zero
+# and every term shares the same chain of doublings.
+
+POINT_WNAF_WIDTH = 5
+
+def wnaf(scalar, width):
+    """width-w non adjacent form of scalar, least significant digit first"""
+
+    digits = []
+    while scalar > 0:
+        if scalar & 1:
+            digit = scalar & (2 ** width - 1)
+            if digit >= 2 ** (width - 1):
+                digit -= 2 ** width
+            scalar -= digit
+        else:
+            digit = 0
+
+        digits.append(digit)
+        scalar >>= 1
+
+    return digits
+
+
+def oddMultiples(p, width):
+    """p, 3p, 5p, ... (2^(width-1) - 1)p as jacobian points"""
+
+    doubled = jacobianDouble(p)
+    result = [p]
+    for _ in range(2 ** (width - 2) - 1):
+        result.append(jacobianAdd(result[-1], doubled))
+    return result
+
+
+def multiScalarMultiply(terms):
+    """sum of every term, each given as (oddMultiples(p, w), wnaf(k, w)) for k*p"""
+
+    length = max(len(digits) for (_, digits) in terms)
+    Q = JacobianInfinity
+
+    for i in range(length - 1, -1, -1):
+        Q = jacobianDouble(Q)
+
+        for (multiples, digits) in terms:
+            if i >= len(digits):
+                continue
+
+            digit = digits[i]
+            if digit > 0:
+                Q = jacobianAdd(Q, multiples[digit >> 1])
+            elif digit < 0:
+                Q = jacobianAdd(Q, jacobianNegate(multiples[(-digit) >> 1]))
+
+    return Q
+
+
+# GLV endomorphism. secp256k1 has an efficiently computable map
+# (x, y) -> (BETA * x, y) that equals multiplication by LAMBDA, so a scalar
+# k splits into k1 + k2 * LAMBDA with k1, k2 around 128 bits each and the
+# number of doublings in a multiply is roughly halved.
+
+BETA = 0x7AE96A2B657C07106E64479EAC3434E99CF0497512F58995C1396C28719501EE
+LAMBDA = 0x5363AD4CC05C30E0A5261C028812645A122E22EA20816678DF02967C1B23BD72
+
+# short basis of the lattice {(a, b) : a + b * LAMBDA == 0 mod N}
+GLV_A1 = 0x3086D221A7D46BCDE86C90E49284EB15
+GLV_B1 = -0xE4437ED6010E88286F547FA90ABFE4C3
+GLV_A2 = 0x114CA50F7A8E2F3F657C1108D9D44CFD8
+GLV_B2 = GLV_A1
+
+def endomorphism(p):
+    """LAMBDA * p for a jacobian point, scaling X also scales the affine x"""
+    return ((BETA * p[0]) % Pcurve, p[1], p[2])
+
+
+def glvSplit(scalar):
+    """(k1, k2) with k1 + k2 * LAMBDA == scalar mod N, both possibly negative"""
+
+    c1 = (GLV_B2 * scalar + N // 2) // N
+    c2 = (-GLV_B1 * scalar + N // 2) // N
+
+    k1 = scalar - c1 * GLV_A1 - c2 * GLV_A2
+    k2 = -c1 * GLV_B1 - c2 * GLV_B2
+    return (k1, k2)
+
+
+def _signedTerm(multiples, scalar, width):
+    digits = wnaf(abs(scalar), width)
+    if scalar < 0:
+        digits = [-digit for digit in digits]
+    return (multiples, digits)
+
+
+def glvTerms(multiples, endoMultiples, scalar, width):
+    """multiScalarMultiply terms for scalar * p given the odd multiples of p and LAMBDA * p"""
+
+    (k1, k2) = glvSplit(scalar)
+    return [_signedTerm(multiples, k1, width), _signedTerm(endoMultiples, k2, width)]
+
+
+def glvMultiply(p, scalar):
+    """scalar * p for a jacobian point p and 0 <= scalar < N"""
+
+    multiples = oddMultiples(p, POINT_WNAF_WIDTH)
+    endoMultiples = [endomorphism(q) for q in multiples]
+    return multiScalarMultiply(glvTerms(multiples, endoMultiples, scalar, POINT_WNAF_WIDTH))
 
 
 # Custom code using the eliptic curve
 
+import os
 import random
+import multiprocessing
+from functools import lru_cache
 from hashlib import sha256
 from utility import paddedBytes
 
+# Fixed base multiplication for the generator point. The table holds
+# j * 2^(w*i) * G for every window i and digit j, so k*G becomes one mixed
+# addition per non zero window of k and no doublings at all.
+
+GENERATOR_WINDOW = 4
+GENERATOR_WINDOWS = (256 + GENERATOR_WINDOW - 1) // GENERATOR_WINDOW
+
+# set to a file path to keep the generator table between runs
+generatorTableCachePath = None
+
+_generatorTable = None
+
+def _buildGeneratorTable():
+    table = []
+    base = toJacobian(GPoint)
+
+    for _ in range(GENERATOR_WINDOWS):
+        row = [base]
+        for _ in range(2 ** GENERATOR_WINDOW - 2):
+            row.append(jacobianAdd(row[-1], base))
+
+        # (2^w - 1) * base + base is the base of the next window
+        base = jacobianAdd(row[-1], base)
+        table.append([toJacobian(fromJacobian(p)) for p in row])
+
+    return table
+
+
+def _saveGeneratorTable(table, path):
+    data = bytearray(paddedBytes(GENERATOR_WINDOW, 1))
+    for row in table:
+        for (x, y, _) in row:
+            data += paddedBytes(x, 32) + paddedBytes(y, 32)
+
+    # write to a temporary file first so a reader never sees a partial table
+    tempPath = path + ".tmp"
+    with open(tempPath, "wb") as f:
+        f.write(data)
+    os.replace(tempPath, path)
+
+
+def _loadGeneratorTable(path):
+    rowSize = 2 ** GENERATOR_WINDOW - 1
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) != 1 + GENERATOR_WINDOWS * rowSize * 64 or data[0] != GENERATOR_WINDOW:
+        raise ValueError("Generator table cache does not match the current window size.")
+
+    table = []
+    offset = 1
+    for _ in range(GENERATOR_WINDOWS):
+        row = []
+        for _ in range(rowSize):
+            x = int.from_bytes(data[offset:offset + 32], 'big')
+            y = int.from_bytes(data[offset + 32:offset + 64], 'big')
+            row.append((x, y, 1))
+            offset += 64
+        table.append(row)
+
+    if not _checkGeneratorTable(table):
+        raise ValueError("Generator table cache is corrupt.")
+
+    return table
+
+
+def _checkGeneratorTable(table):
+    """whether the table starts at G and every point follows from the one before,
+    row[j] = row[j-1] + row[0] and each row starts at the previous row[-1] + row[0].
+    every slope is checked with one batched inversion, far cheaper than a rebuild"""
+
+    if table[0][0] != toJacobian(GPoint):
+        return False
+
+    # (previous point, row base, expected sum) for every point after the first
+    steps = []
+    for (i, row) in enumerate(table):
+        for j in range(1, len(row)):
+            steps.append((row[j - 1], row[0], row[j]))
+        if i + 1 < len(table):
+            steps.append((row[-1], row[0], table[i + 1][0]))
+
+    denominators = [(2 * a[1] if a == b else b[0] - a[0]) % Pcurve for (a, b, _) in steps]
+    if 0 in denominators:
+        return False
+
+    for ((a, b, c), inverse) in zip(steps, batchModinv(denominators)):
+        if a == b:
+            slope = (3 * a[0] * a[0] * inverse) % Pcurve
+        else:
+            slope = ((b[1] - a[1]) * inverse) % Pcurve
+
+        x = (slope * slope - a[0] - b[0]) % Pcurve
+        y = (slope * (a[0] - x) - a[1]) % Pcurve
+        if (x, y) != (c[0], c[1]):
+            return False
+
+    return True
+
+
+def generatorTable():
+    """lazily build (or load from generatorTableCachePath) the fixed base table"""
+    global _generatorTable
+
+    if _generatorTable is not None:
+        return _generatorTable
+
+    path = generatorTableCachePath
+    if path is not None and os.path.exists(path):
+        try:
+            _generatorTable = _loadGeneratorTable(path)
+            return _generatorTable
+        except (OSError, ValueError):
+            pass # rebuild a stale or corrupt cache below
+
+    _generatorTable = _buildGeneratorTable()
+
+    if path is not None:
+        try:
+            _saveGeneratorTable(_generatorTable, path)
+        except OSError:
+            pass # caching is only an optimisation
+
+    return _generatorTable
+
+
+GENERATOR_WNAF_WIDTH = 8
+
+_generatorOddMultiples = None
+_generatorEndoMultiples = None
+
+def generatorOddMultiples():
+    """affine odd multiples of GPoint and of LAMBDA * GPoint used by doubleScalarMultiply"""
+    global _generatorOddMultiples, _generatorEndoMultiples
+
+    if _generatorOddMultiples is None:
+        multiples = oddMultiples(toJacobian(GPoint), GENERATOR_WNAF_WIDTH)
+        _generatorOddMultiples = [toJacobian(fromJacobian(p)) for p in multiples]
+        _generatorEndoMultiples = [endomorphism(p) for p in _generatorOddMultiples]
+
+    return (_generatorOddMultiples, _generatorEndoMultiples)
+
+
+def doubleScalarMultiply(u1, u2, p):
+    """u1 * GPoint + u2 * p as a jacobian point, sharing one chain of doublings"""
+
+    (gMultiples, gEndoMultiples) = generatorOddMultiples()
+    pMultiples = oddMultiples(p, POINT_WNAF_WIDTH)
+    pEndoMultiples = [endomorphism(q) for q in pMultiples]
+
+    return multiScalarMultiply(
+        glvTerms(gMultiples, gEndoMultiples, u1, GENERATOR_WNAF_WIDTH) +
+        glvTerms(pMultiples, pEndoMultiples, u2, POINT_WNAF_WIDTH))
+
+
+def generatorMultiply(scalar):
+    """scalar * GPoint as a jacobian point using the fixed base table"""
+
+    mask = 2 ** GENERATOR_WINDOW - 1
+    Q = JacobianInfinity
+
+    for row in generatorTable():
+        if scalar == 0:
+            break
+
+        digit = scalar & mask
+        if digit:
+            Q = jacobianAdd(Q, row[digit - 1])
+        scalar >>= GENERATOR_WINDOW
+
+    return Q
+
+
 # generate keys
 
 def generatePrivateKey():
@@ -111,6 +496,11 @@ def uncompressPublicKey(compressedPublicKeyBytes):
     return paddedBytes(4, 1) + paddedBytes(x, 32) + paddedBytes(y, 32)
 
 
+# the same wallet keys are verified again and again, cache their points
+# (hits and misses are available through publicKeyPoint.cache_info())
+PUBLIC_KEY_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
 def publicKeyPoint(publicKeyBytes):
     if (len(publicKeyBytes) != 33 and len(publicKeyBytes) != 65):
         raise ValueError("Public key must be 33 or 65 bytes long.")
@@ -152,9 +542,95 @@ def verifySignature(messageBytes, signature, publicKeyBytes):
     pk = publicKeyPoint(publicKeyBytes)
 
     w = modinv(sigFactor, N)
-    u1 = EccMultiply(GPoint, (messageValue * w) % N)
-    u2 = EccMultiply(pk, (r * w) % N)
+    u1 = (messageValue * w) % N
+    u2 = (r * w) % N
+
+    sumPoint = doubleScalarMultiply(u1, u2, toJacobian(pk))
+    if sumPoint[2] == 0:
+        return False
+
+    (x, _) = fromJacobian(sumPoint)
+
+    return x % N == r
+
+
+# batch verification
+
+VERIFY_CHUNK_SIZE = 64
+
+def _verifyChunk(batch):
+    results = [False] * len(batch)
+    pending = []
+
+    for (i, (messageBytes, signature, publicKeyBytes)) in enumerate(batch):
+        sigFactor, r = signature
+        if not (0 < sigFactor < N and 0 < r < N):
+            continue
+
+        try:
+            pk = publicKeyPoint(publicKeyBytes)
+        except ValueError:
+            continue
+
+        messageValue = int.from_bytes(sha256(messageBytes).digest(), 'big')
+        pending.append((i, messageValue, sigFactor, r, pk))
+
+    if not pending:
+        return results
+
+    # one inversion mod N for every w and one mod Pcurve for every result point
+    ws = batchModinv([sigFactor for (_, _, sigFactor, _, _) in pending], N)
+
+    points = []
+    for ((i, messageValue, _, r, pk), w) in zip(pending, ws):
+        sumPoint = doubleScalarMultiply((messageValue * w) % N, (r * w) % N, toJacobian(pk))
+        if sumPoint[2] != 0:
+            points.append((i, r, sumPoint))
+
+    zInvs = batchModinv([p[2] for (_, _, p) in points], Pcurve)
+    for ((i, r, p), zInv) in zip(points, zInvs):
+        x = (p[0] * zInv * zInv) % Pcurve
+        results[i] = x % N == r
+
+    return results
+
+
+# worker pool for large batches, created on first use and kept so verifying
+# a block does not start and stop processes every time
+_verifyPool = None
+_verifyPoolSize = 0
+
+def _verificationPool(processes):
+    global _verifyPool, _verifyPoolSize
+
+    if _verifyPool is not None and _verifyPoolSize == processes:
+        return _verifyPool
+
+    if _verifyPool is not None:
+        _verifyPool.terminate()
+
+    # build the shared tables first so forked workers inherit them
+    generatorOddMultiples()
+
+    _verifyPool = multiprocessing.Pool(processes)
+    _verifyPoolSize = processes
+    return _verifyPool
+
+
+def verifySignatures(batch, processes=None, chunkSize=VERIFY_CHUNK_SIZE):
+    """verify many (messageBytes, signature, publicKeyBytes) triples, returns a list of bools
+
+    batches larger than chunkSize are split across a pool of processes
+    (defaults to one per cpu), pass processes=1 to stay in this process"""
+
+    batch = list(batch)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes <= 1 or len(batch) <= chunkSize:
+        return _verifyChunk(batch)
 
-    (x, _) = EccAdd(u1, u2)
+    chunks = [batch[i:i + chunkSize] for i in range(0, len(batch), chunkSize)]
+    chunkResults = _verificationPool(processes).map(_verifyChunk, chunks)
 
-    return x == r
+    return [result for results in chunkResults for result in results]
@@ -1,11 +1,25 @@
+import os
 from node import Node, connect
+from basenode import networkLock
 from miner import Miner
+from light import LightNode
+from network import MessageBus
 from utility import paddedBytes
 
 class Interface(object):
 
-    def __init__(self):
-        self.relayNode = Node("Interface Relay Node")
+    def __init__(self, useMessageBus=True, dataDir=None, pruneDepth=None):
+        # without a message bus nodes gossip through direct recursive calls
+        self.messageBus = MessageBus() if useMessageBus else None
+
+        # when given every node keeps its blocks in its own directory under dataDir
+        self.dataDir = dataDir
+
+        # spoke nodes keep only this many recent block bodies, the relay node keeps all
+        self.pruneDepth = pruneDepth
+
+        self.relayNode = Node("Interface Relay Node", dataDir=self.nodeDataDir("relay"))
+        self.relayNode.setMessageBus(self.messageBus)
         self.nodes = {self.relayNode.label: self.relayNode}
 
 
@@ -13,25 +27,61 @@ class Interface(object):
         if label in self.nodes:
             raise ValueError("A node labelled '{}' already exists.".format(label))
 
-        newNode = Miner(label)
+        newNode = Miner(label, dataDir=self.nodeDataDir(label), pruneDepth=self.pruneDepth)
+        newNode.setMessageBus(self.messageBus)
         newNode.addPeer(self.relayNode) # relayNode will hear but not send out txs/blocks
 
         self.nodes[label] = newNode
 
 
-    def newMiner(self, label):
+    def newMiner(self, label, workers=1):
         if label in self.nodes:
             raise ValueError("A node labelled '{}' already exists.".format(label))
 
-        newNode = Miner(label)
+        newNode = Miner(label, int(workers), dataDir=self.nodeDataDir(label), pruneDepth=self.pruneDepth)
+        newNode.setMessageBus(self.messageBus)
         newNode.addPeer(self.relayNode)
 
         self.nodes[label] = newNode
 
 
+    def newLight(self, label):
+        if label in self.nodes:
+            raise ValueError("A node labelled '{}' already exists.".format(label))
+
+        # headers only, its wallet is proven against the relay node and any full peers
+        newNode = LightNode(label)
+        newNode.setMessageBus(self.messageBus)
+        newNode.addPeer(self.relayNode)
+
+        # the relay node never forwards, so the light node's txs reach miners
+        # only through full nodes it is connected to
+        for node in list(self.nodes.values()):
+            if node is not self.relayNode and not isinstance(node, LightNode):
+                connect(newNode, node)
+
+        newNode.synchronize()
+
+        self.nodes[label] = newNode
+
+
+    def nodeDataDir(self, label):
+        if self.dataDir is None:
+            return None
+        return os.path.join(self.dataDir, label)
+
+
     def connectNodes(self, labelA, labelB):
         connect(self.nodes[labelA], self.nodes[labelB])
 
+        # newly connected nodes catch up with each other
+        self.nodes[labelA].synchronize()
+        self.nodes[labelB].synchronize()
+
+
+    def sync(self, label):
+        return self.nodes[label].synchronize()
+
 
     def send(self, labelA, labelB, amount):
         if labelA == labelB:
@@ -45,22 +95,31 @@ class Interface(object):
         self.nodes[label].mineCurrentMempool()
 
 
+    def startMining(self, label):
+        self.nodes[label].startMining()
+
+
+    def stopMining(self, label):
+        self.nodes[label].stopMining()
+
+
+    def snapshot(self, label):
+        self.nodes[label].writeSnapshot()
+
+
     def blockchain(self):
         return self.relayNode.currentBlockChain()
 
 
     def block(self, blockHash):
         blockHashBytes = paddedBytes(int(blockHash, base=16), 32)
-        return self.relayNode.blocks[blockHashBytes]
+        with networkLock:
+            return self.relayNode.blocks[blockHashBytes]
 
 
     def tx(self, txHash):
         txHashBytes = paddedBytes(int(txHash, base=16), 32)
-
-        for (_, block) in self.relayNode.blocks.items():
-            for tx in block.transactions:
-                if tx.toHash() == txHashBytes:
-                    return tx
+        return self.relayNode.findTx(txHashBytes)
 
     def owner(self, address):
         for (_, node) in self.nodes.items():
@@ -0,0 +1,234 @@
+from basenode import BaseNode, synchronized
+from block import GenesisBlock, verifyMerkleBranch
+from chainindex import BlockIndex
+from network import INV_TX, INV_BLOCK
+from node import MAX_HEADERS
+
+
+class LightNode(BaseNode):
+    """wallet node keeping only the block header chain, its own outputs are
+    checked against the headers with merkle branches served by full peers.
+
+    a branch proves a tx is in the best chain but not that its outputs are
+    still unspent, for that the node trusts the peer it asks"""
+
+    def __init__(self, label=None):
+        super(LightNode, self).__init__(label, "Light")
+
+        # headers only, no block bodies, utxo set or mempool
+        self.blockIndex = BlockIndex(GenesisBlock().blockHeader)
+
+        # outpoint -> txOut paying to us, each proven to be in our best chain
+        self.outputs = {}
+        self.walletTip = None # header tip the outputs were checked at
+
+        # outpoint -> hash of our own tx spending it, until the spend is confirmed
+        self.pendingSpends = {}
+
+
+    # headers
+
+    def oldestServedHeight(self):
+        # no bodies are kept, so none can be served
+        return self.blockHeight() + 1
+
+
+    @synchronized
+    def getHeaders(self, locator, maxHeaders=MAX_HEADERS):
+        return self.blockIndex.headersAfter(locator, maxHeaders)
+
+
+    def addHeaders(self, headers):
+        """index headers linking up from a known block, returns whether all were added"""
+
+        if not self.blockIndex.checkHeaders(headers):
+            return False
+
+        for header in headers:
+            self.blockIndex.add(header)
+        return True
+
+
+    @synchronized
+    def synchronize(self):
+        """fetch header chains from our peers until none has more,
+        then check our outputs against the new tip. returns headers added"""
+
+        added = 0
+
+        while True:
+            locator = self.blockIndex.locator()
+
+            count = len(self.blockIndex)
+            for peer in self.peers:
+                self.addHeaders(peer.getHeaders(locator))
+
+            if len(self.blockIndex) == count:
+                break
+            added += len(self.blockIndex) - count
+
+        self.updateWallet()
+        return added
+
+
+    def receiveHeader(self, header):
+        if header.blockHash() in self.blockIndex:
+            return
+
+        # an unknown parent means we are behind, catch up from every peer
+        if not self.addHeaders([header]):
+            self.synchronize()
+            return
+
+        self.updateWallet()
+
+
+    # messages from full peers, only the headers of blocks are kept
+
+    @synchronized
+    def receiveInv(self, message):
+        (_, kind, objHash) = message
+
+        if kind == INV_BLOCK and objHash not in self.blockIndex:
+            self.synchronize()
+
+
+    @synchronized
+    def receiveCompactBlock(self, message):
+        (_, compactBlock) = message
+        self.receiveHeader(compactBlock.blockHeader)
+
+
+    @synchronized
+    def receiveBlock(self, block):
+        self.receiveHeader(block.blockHeader)
+
+
+    def receiveTx(self, tx):
+        # no mempool, unconfirmed txs are not tracked
+        pass
+
+
+    def receiveNotFound(self, objHash):
+        pass
+
+
+    def hasInventory(self, kind, objHash):
+        return False
+
+
+    @synchronized
+    def receiveGetData(self, message):
+        (peer, kind, objHash) = message
+        self.sendTo(peer, "receiveNotFound", objHash, kind)
+        self.flushMessages()
+
+
+    def getUnspentOutputs(self, address):
+        return None
+
+
+    def getTxProof(self, txHash):
+        return None
+
+
+    # wallet
+
+    def verifyTxProof(self, txHash, proof, bestChain):
+        """whether the proof shows a tx with txHash in a block of our best chain"""
+
+        (tx, blockHash, position, branch) = proof
+
+        if tx.toHash() != txHash or blockHash not in bestChain:
+            return False
+
+        merkleRoot = self.blockIndex.get(blockHash).blockHeader.merkleRoot
+        return verifyMerkleBranch(txHash, position, branch, merkleRoot)
+
+
+    def fetchOutputs(self, peer, bestChain):
+        """our outputs as reported by peer, only those proven against our
+        headers are kept. returns None if the peer cannot serve proofs"""
+
+        unspent = peer.getUnspentOutputs(self.address)
+        if unspent is None:
+            return None
+
+        outputs = {}
+        proofs = {}
+        for (outpoint, _) in unspent:
+            (txHash, i) = outpoint
+
+            if txHash not in proofs:
+                proofs[txHash] = peer.getTxProof(txHash)
+
+            proof = proofs[txHash]
+            if proof is None or not self.verifyTxProof(txHash, proof, bestChain):
+                continue
+
+            # the amount comes from the proven tx, not the peer's claim
+            txOuts = proof[0].outputs
+            if i < len(txOuts) and txOuts[i].address == self.address:
+                outputs[outpoint] = txOuts[i]
+
+        return outputs
+
+
+    def expirePendingSpends(self):
+        """forget spends whose tx no peer holds any more, it was rejected,
+        dropped or evicted unconfirmed so its outputs can be spent again"""
+
+        held = {}
+        for (outpoint, txHash) in list(self.pendingSpends.items()):
+            if txHash not in held:
+                held[txHash] = any(peer.hasInventory(INV_TX, txHash) for peer in self.peers)
+
+            if not held[txHash]:
+                del self.pendingSpends[outpoint]
+
+
+    @synchronized
+    def updateWallet(self):
+        self.expirePendingSpends()
+
+        if self.blockIndex.tip is self.walletTip:
+            return
+
+        bestChain = set(entry.blockHash for entry in self.blockIndex.chain())
+
+        # the first full peer answering wins, peers can only hide outputs, not invent them
+        for peer in self.peers:
+            outputs = self.fetchOutputs(peer, bestChain)
+            if outputs is None:
+                continue
+
+            # spends no longer reported as unspent have been confirmed
+            for outpoint in list(self.pendingSpends):
+                if outpoint not in outputs:
+                    del self.pendingSpends[outpoint]
+
+            self.outputs = outputs
+            self.walletTip = self.blockIndex.tip
+            return
+
+
+    @synchronized
+    def unspentOutputs(self):
+        """returns an array of tuples of (outpoint, txOut) paying to our address"""
+
+        self.updateWallet()
+        return [(outpoint, txOut) for (outpoint, txOut) in self.outputs.items() if outpoint not in self.pendingSpends]
+
+
+    def spendableOutputs(self):
+        return self.unspentOutputs()
+
+
+    def submitTx(self, tx):
+        for txIn in tx.inputs:
+            self.pendingSpends[(txIn.prevTxHash, txIn.prevTxOutIndex)] = tx.toHash()
+
+        # full peers validate and relay it, we keep no copy
+        for peer in self.peers:
+            self.sendTo(peer, "receiveTx", tx, INV_TX)
+        self.flushMessages()
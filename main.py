@@ -26,11 +26,18 @@ def new(args):
 
     if nodeType.lower() == 'miner':
         try:
-            interface.newMiner(label)
+            interface.newMiner(label, *args[2:3])
             print("New miner node '{}' created.".format(label))
         except ValueError as e:
             print(e)
 
+    elif nodeType.lower() == 'light':
+        try:
+            interface.newLight(label)
+            print("New light node '{}' created.".format(label))
+        except ValueError as e:
+            print(e)
+
     elif nodeType.lower() == 'node' or nodeType.lower() == 'basic':
         try:
             interface.newNode(label)
@@ -39,7 +46,7 @@ def new(args):
             print(e)
 
     else:
-        print("No node created. 'nodeType' must be 'miner' or 'basic'/'node'.")
+        print("No node created. 'nodeType' must be 'miner', 'light' or 'basic'/'node'.")
 
 
 def printAll(args):
@@ -134,6 +141,43 @@ def mine(args):
     print("New block mined by '{}'.".format(*args))
 
 
+def automine(args):
+    if len(args) < 2 or args[1] not in ("start", "stop"):
+        print("'automine' command requires '<label>' and 'start' or 'stop' arguments.")
+        return
+
+    (label, action) = args[:2]
+    if action == "start":
+        interface.startMining(label)
+        print("'{}' is mining in the background.".format(label))
+    else:
+        interface.stopMining(label)
+        print("'{}' stopped background mining.".format(label))
+
+
+def sync(args):
+    if len(args) < 1:
+        print("'sync' command requires '<label>' argument.")
+        return
+
+    count = interface.sync(*args)
+    print("'{}' requested {} block(s) from its peers.".format(args[0], count))
+
+
+def snapshot(args):
+    if len(args) < 1:
+        print("'snapshot' command requires '<label>' argument.")
+        return
+
+    try:
+        interface.snapshot(*args)
+    except ValueError as e:
+        print(e)
+        return
+
+    print("Chainstate snapshot written for '{}'.".format(args[0]))
+
+
 def blockchain(args):
     print("Showing current blockchain.")
     for block in interface.blockchain():
@@ -180,6 +224,12 @@ def owner(args):
 
 
 def main(args):
+    global interface
+
+    # optional directory to keep every node's blocks on disk
+    if len(args) > 1:
+        interface = Interface(dataDir=args[1])
+
     print("Python Blockchain REPL v0.1")
     print("Type 'help' for list of commands.")
     print("Type 'quit' to exit.")
@@ -187,13 +237,16 @@ def main(args):
     # command, description, method
     commands["quit"]    = ("Exit from REPL.",                           quit)
     commands["help"]    = ("List all commands.",                        printHelp)
-    commands["new"]     = ("<nodeType> <label> Create a new node.",     new)
+    commands["new"]     = ("<nodeType> <label> [workers] Create a new node.", new)
     commands["all"]     = ("Print all existing nodes.",                 printAll)
     commands["show"]    = ("<label> Show details of particular node.",  showNode)
     commands["connect"] = ("<labelA> <labelB> Connect two peers in the network.", connect)
     commands["load"]    = ("<scriptName> Load script.",                 load)
     commands["send"]    = ("<labelA> <labelB> <amount> Pay <amount> from one node to an other.", send)
     commands["mine"]    = ("<label> Mine current mempool.",             mine)
+    commands["automine"] = ("<label> start|stop Mine in the background, restarting on new blocks.", automine)
+    commands["sync"]    = ("<label> Catch up with peers, headers first.", sync)
+    commands["snapshot"] = ("<label> Write a chainstate snapshot for fast restarts.", snapshot)
     commands["blockchain"] = ("Display the current blockchain.",        blockchain)
     commands["block"]   = ("<blockHash> Display the block of with given hash for a node. ", block)
     commands["tx"]      = ("<txHash> Display the transaction of a given hash for a node.", tx)
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+
+MEMPOOL_MAX_SIZE = 10000
+MEMPOOL_MAX_AGE = 60 * 60 # seconds
+
+class MemPool(object):
+    """unconfirmed txs keyed by hash in arrival order, with an index of the
+    outpoints they spend so conflicting txs are found in O(1)"""
+
+    def __init__(self, maxSize=MEMPOOL_MAX_SIZE, maxAge=MEMPOOL_MAX_AGE):
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+
+        self.txs = OrderedDict() # txHash -> (tx, arrival time)
+        self.spentBy = {} # outpoint -> txHash
+
+
+    def __len__(self):
+        return len(self.txs)
+
+
+    def __iter__(self):
+        return (tx for (tx, _) in list(self.txs.values()))
+
+
+    def __contains__(self, txHash):
+        return txHash in self.txs
+
+
+    def get(self, txHash):
+        entry = self.txs.get(txHash)
+        return None if entry is None else entry[0]
+
+
+    def isSpent(self, outpoint):
+        return outpoint in self.spentBy
+
+
+    def conflicts(self, tx):
+        """hashes of the txs in the pool spending any of the outputs tx spends"""
+        return set(self.spentBy[outpoint] for outpoint in self.outpoints(tx) if outpoint in self.spentBy)
+
+
+    @staticmethod
+    def outpoints(tx):
+        return [(txIn.prevTxHash, txIn.prevTxOutIndex) for txIn in tx.inputs]
+
+
+    def add(self, tx, now=None):
+        """add tx unless already present or conflicting, returns whether it was added"""
+
+        txHash = tx.toHash()
+        if txHash in self.txs or self.conflicts(tx):
+            return False
+
+        now = time.time() if now is None else now
+        self.txs[txHash] = (tx, now)
+        for outpoint in self.outpoints(tx):
+            self.spentBy[outpoint] = txHash
+
+        self.evict(now)
+        return txHash in self.txs
+
+
+    def remove(self, txHash):
+        entry = self.txs.pop(txHash, None)
+        if entry is None:
+            return None
+
+        for outpoint in self.outpoints(entry[0]):
+            if self.spentBy.get(outpoint) == txHash:
+                del self.spentBy[outpoint]
+
+        return entry[0]
+
+
+    def removeBlock(self, block):
+        """drop the block's txs and any tx double spending an output the block spends"""
+
+        for tx in block.transactions:
+            self.remove(tx.toHash())
+
+            for conflict in self.conflicts(tx):
+                self.remove(conflict)
+
+
+    def evict(self, now=None):
+        """drop txs older than maxAge, then the oldest txs while over maxSize"""
+
+        now = time.time() if now is None else now
+
+        while self.txs:
+            (txHash, (_, arrival)) = next(iter(self.txs.items()))
+            if now - arrival <= self.maxAge and len(self.txs) <= self.maxSize:
+                break
+            self.remove(txHash)
@@ -1,43 +1,236 @@
+import threading
 from hashlib import sha256
+from queue import Empty
 from random import random, randint
+from multiprocessing import Event, Process, Queue
 from node import Node
-from block import Block, UnminedBlock
+from basenode import networkLock, synchronized
+from block import Block, UnminedBlock, targetBytes
 
-TARGET_SIZE = 256
-TARGET_ZEROS = 8
+NONCE_SPACE = 2 ** 32
+
+# how many nonces a worker tries between checks for a solution found elsewhere
+STOP_CHECK_INTERVAL = 4096
+
+# background mining restarts its template once this many txs arrive
+MEMPOOL_RESTART_THRESHOLD = 10
+
+
+def findNonce(headerPrefix, start, count, found=None):
+    """first nonce in count nonces from start whose header hash meets the target, or None
+
+    prevBlockHash + merkleRoot is exactly one 64 byte sha256 block, so its
+    state is computed once and copied for every nonce"""
+
+    midstate = sha256(headerPrefix)
+
+    for chunkStart in range(0, count, STOP_CHECK_INTERVAL):
+        if found is not None and found.is_set():
+            return None
+
+        for n in range(chunkStart, min(chunkStart + STOP_CHECK_INTERVAL, count)):
+            nonce = (start + n) & (NONCE_SPACE - 1)
+
+            hashed = midstate.copy()
+            hashed.update(nonce.to_bytes(4, 'big'))
+
+            if hashed.digest() <= targetBytes:
+                return nonce
+
+    return None
+
+
+def _searchNonces(headerPrefix, start, count, found, results):
+    """worker process, tries count nonces from start and reports the first valid one or None"""
+
+    nonce = findNonce(headerPrefix, start, count, found)
+    if nonce is not None:
+        found.set()
+    results.put(nonce)
 
-target_binary = '0' * TARGET_ZEROS + '1' * (TARGET_SIZE - TARGET_ZEROS)
-target = int(target_binary, base=2)
 
 class Miner(Node):
 
-    def __init__(self, label=None):
-        super(Miner, self).__init__(label)
+    def __init__(self, label=None, workers=1, txIndex=True, dataDir=None, pruneDepth=None):
+        super(Miner, self).__init__(label, txIndex, dataDir, pruneDepth)
         self.nodeType = "Miner"
 
+        # number of processes the nonce space is split across
+        self.workers = workers
 
-    def mine(self, unminedBlock):
-        unminedBlock.addRewardTransaction(self.address, len(self.currentBlockChain()))
-        header = unminedBlock.incompleteBlockHeader()
-
-        start = randint(0, 2 ** 32 - 1)
-        for n in range(2 ** 32):
-            nonce = (start + n) % 2 ** 32
+        # background mining state
+        self.mempoolThreshold = MEMPOOL_RESTART_THRESHOLD
+        self.miningThread = None
+        self.stopEvent = threading.Event()
+        self.staleWork = threading.Event()
+        self.templateTip = None
+        self.templateSize = 0
 
-            header.setNonce(nonce)
-            tempBlockHash = header.blockHash()
 
-            if int(tempBlockHash.hex(), 16) <= target:
-                break
+    def mine(self, unminedBlock):
+        with networkLock:
+            # the reward height follows the template's parent, the tip may move while solving
+            height = self.blockIndex.get(unminedBlock.prevBlockHash).height + 1
+            unminedBlock.addRewardTransaction(self.address, height)
 
+        # the nonce search runs without the lock so the network keeps going
+        header = self.solveBlock(unminedBlock)
         block = Block(unminedBlock.transactions, header)
         self.receiveBlock(block)
 
         return block
 
 
+    def solveBlock(self, unminedBlock, abort=None):
+        """search nonces (and extra nonces) until the header meets the target,
+        returns the header or None once abort is set"""
+
+        while True:
+            header = unminedBlock.incompleteBlockHeader()
+
+            start = randint(0, NONCE_SPACE - 1)
+            if self.workers > 1:
+                nonce = self.parallelNonceSearch(header, start, abort)
+            else:
+                nonce = findNonce(header.prevBlockHash + header.merkleRoot, start, NONCE_SPACE, abort)
+
+            if abort is not None and abort.is_set():
+                return None
+
+            if nonce is not None:
+                header.setNonce(nonce)
+                return header
+
+            # nonce space exhausted, change the merkle root and search again
+            unminedBlock.incrementExtraNonce()
+
+
+    def parallelNonceSearch(self, header, start, abort=None):
+        """split the nonce space across self.workers processes, returns the first valid nonce found"""
+
+        headerPrefix = header.prevBlockHash + header.merkleRoot
+        found = Event()
+        results = Queue()
+
+        span = -(-NONCE_SPACE // self.workers)
+        workers = []
+        for i in range(self.workers):
+            workerStart = (start + i * span) % NONCE_SPACE
+            count = min(span, NONCE_SPACE - i * span)
+
+            worker = Process(target=_searchNonces, args=(headerPrefix, workerStart, count, found, results))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        nonce = None
+        remaining = len(workers)
+        while remaining > 0:
+            if abort is not None and abort.is_set():
+                break
+
+            try:
+                nonce = results.get(timeout=0.1)
+            except Empty:
+                continue
+
+            remaining -= 1
+            if nonce is not None:
+                break
+
+        # stop the remaining workers
+        found.set()
+        for worker in workers:
+            worker.join()
+
+        return nonce
+
+
     def mineCurrentMempool(self):
-        unmined = UnminedBlock(self.memPool, self.latestBlock().blockHeader.blockHash())
+        with networkLock:
+            unmined = UnminedBlock(list(self.memPool), self.latestBlock().blockHeader.blockHash())
+
+        # receiving the mined block removes its txs from the mempool
         self.mine(unmined)
 
-        self.memPool = []
+
+    # background mining
+
+    def startMining(self):
+        if self.miningThread is not None:
+            raise ValueError("Miner is already mining in the background.")
+
+        self.stopEvent.clear()
+        self.miningThread = threading.Thread(target=self.miningLoop, daemon=True)
+        self.miningThread.start()
+
+
+    def stopMining(self):
+        if self.miningThread is None:
+            return
+
+        self.stopEvent.set()
+        self.staleWork.set()
+        self.miningThread.join()
+
+        self.miningThread = None
+        self.templateTip = None
+
+
+    def miningLoop(self):
+        unmined = None
+        included = set()
+
+        while not self.stopEvent.is_set():
+
+            with networkLock:
+                self.staleWork.clear()
+                tip = self.latestBlock().blockHeader.blockHash()
+
+                if unmined is None or unmined.prevBlockHash != tip:
+                    # build a fresh template from the current tip and mempool
+                    unmined = UnminedBlock(list(self.memPool), tip)
+                    unmined.addRewardTransaction(self.address, self.blockHeight() + 1)
+                    included = set(tx.toHash() for tx in unmined.transactions)
+                else:
+                    # same tip, only extend the template with the new txs
+                    for tx in self.memPool:
+                        if tx.toHash() not in included:
+                            unmined.addTransaction(tx)
+                            included.add(tx.toHash())
+
+                self.templateTip = tip
+                self.templateSize = len(self.memPool)
+
+            header = self.solveBlock(unmined, self.staleWork)
+            if header is None:
+                continue
+
+            with networkLock:
+                # a new tip may have arrived after the nonce was found
+                if self.staleWork.is_set():
+                    continue
+
+                self.receiveBlock(Block(unmined.transactions, header))
+                unmined = None
+
+
+    def checkStaleWork(self):
+        if self.templateTip is None:
+            return
+
+        tipChanged = self.latestBlock().blockHeader.blockHash() != self.templateTip
+        if tipChanged or len(self.memPool) - self.templateSize >= self.mempoolThreshold:
+            self.staleWork.set()
+
+
+    @synchronized
+    def receiveTx(self, tx):
+        super(Miner, self).receiveTx(tx)
+        self.checkStaleWork()
+
+
+    @synchronized
+    def receiveBlock(self, block):
+        super(Miner, self).receiveBlock(block)
+        self.checkStaleWork()
@@ -0,0 +1,145 @@
+import time
+from collections import deque, OrderedDict
+
+MAX_QUEUE_SIZE = 1000
+BATCH_SIZE = 16
+
+# inventory kinds announced between peers
+INV_TX = "tx"
+INV_BLOCK = "block"
+
+RECENT_INVENTORY_SIZE = 5000
+
+# seconds to wait for a requested object before asking the next peer announcing it
+REQUEST_TIMEOUT = 2.0
+
+
+class RecentSet(object):
+    """bounded set forgetting the least recently added items first"""
+
+    def __init__(self, maxSize=RECENT_INVENTORY_SIZE):
+        self.maxSize = maxSize
+        self.items = OrderedDict()
+
+
+    def __contains__(self, item):
+        return item in self.items
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def add(self, item):
+        self.items[item] = None
+        self.items.move_to_end(item)
+
+        while len(self.items) > self.maxSize:
+            self.items.popitem(last=False)
+
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+
+class RequestSet(object):
+    """hashes asked for and not received yet, with the peer asked and when.
+    a request that is not answered within timeout no longer counts, so the
+    next announcement of the hash is requested again"""
+
+    def __init__(self, timeout=REQUEST_TIMEOUT, maxSize=RECENT_INVENTORY_SIZE):
+        self.timeout = timeout
+        self.maxSize = maxSize
+        self.items = OrderedDict() # hash -> (peer, time requested)
+
+
+    def __contains__(self, item):
+        request = self.items.get(item)
+        if request is None:
+            return False
+
+        if time.monotonic() - request[1] >= self.timeout:
+            del self.items[item]
+            return False
+
+        return True
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def add(self, item, peer=None):
+        self.items[item] = (peer, time.monotonic())
+        self.items.move_to_end(item)
+
+        while len(self.items) > self.maxSize:
+            self.items.popitem(last=False)
+
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+
+class MessageBus(object):
+    """run to completion scheduler delivering messages between nodes
+
+    every node has an inbound queue, nodes with pending messages take turns
+    handling up to batchSize messages each, and a node's queue is bounded:
+    tx messages sent to a full queue are dropped (counted in dropped), any
+    message carrying or asking for a block is always queued so no node
+    falls off the chain"""
+
+    def __init__(self, maxQueueSize=MAX_QUEUE_SIZE, batchSize=BATCH_SIZE):
+        self.maxQueueSize = maxQueueSize
+        self.batchSize = batchSize
+
+        self.queues = {}
+        self.ready = deque()
+        self.running = False
+
+        self.delivered = 0
+        self.dropped = 0
+
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+
+    def send(self, node, method, payload, kind=INV_BLOCK):
+        """queue a call of node.method(payload), kind is the inventory kind the
+        message is about and only INV_TX messages can be dropped"""
+
+        queue = self.queues.setdefault(node, deque())
+
+        if len(queue) >= self.maxQueueSize and kind == INV_TX:
+            self.dropped += 1
+            return
+
+        if not queue:
+            self.ready.append(node)
+        queue.append((method, payload))
+
+
+    def run(self):
+        """deliver messages until every queue is empty, calls made while
+        delivering only queue more work for the outer run"""
+
+        if self.running:
+            return
+
+        self.running = True
+        try:
+            while self.ready:
+                node = self.ready.popleft()
+                queue = self.queues[node]
+
+                for _ in range(min(self.batchSize, len(queue))):
+                    (method, payload) = queue.popleft()
+                    getattr(node, method)(payload)
+                    self.delivered += 1
+
+                if queue:
+                    self.ready.append(node)
+        finally:
+            self.running = False
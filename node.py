@@ -1,163 +1,627 @@
-from ecc import generateKeyPair, compressPublicKey, generateSignature, verifySignature
+import os
+
+from ecc import verifySignatures
 from base58check import encode
-from block import GenesisBlock
+from basenode import BaseNode, synchronized
+from block import Block, GenesisBlock, CompactBlock
+from chainindex import BlockIndex, OrphanPool, HEADERS_FILE
+from utxo import UtxoSet
+from mempool import MemPool
+from network import RecentSet, RequestSet, INV_TX, INV_BLOCK
+from sigcache import SignatureCache
+from txindex import TxIndex, TX_INDEX_FILE
+from store import BlockStore
+from chainstate import Snapshot, readSnapshot, writeSnapshot, SNAPSHOT_FILE, SNAPSHOT_UNDO_DEPTH
+
+from tx import TxReward
+
+# most headers returned for a single getHeaders request
+MAX_HEADERS = 2000
 
-from tx import Tx, TxIn, TxOut
+# nodes with a data directory snapshot their chainstate every this many connected blocks
+SNAPSHOT_INTERVAL = 100
 
-class Node(object):
 
-    def __init__(self, label=None):
+class Node(BaseNode):
 
-        # Labeling
-        self.nodeType = "Basic"
-        self.label = label
+    def __init__(self, label=None, txIndex=True, dataDir=None, pruneDepth=None):
+        super(Node, self).__init__(label)
 
-        (sk, pk) = generateKeyPair()
-        self.privateKey = sk
-        self.uncompressedPublicKey = pk
+        # announce hashes and let peers request what they lack, instead of pushing objects
+        self.inventoryRelay = True
+        self.peerInventory = {} # peer -> RecentSet of hashes the peer is known to have
+        self.requested = RequestSet() # hashes asked for and not received yet, re-asked after a timeout
 
-        cpk = compressPublicKey(pk)
-        self.publicKey = cpk
-        self.address = encode(cpk)
+        # push new blocks as compact blocks rebuilt from the peer's mempool
+        self.compactBlocks = True
+        self.partialBlocks = {} # blockHash -> (compactBlock, transactions with None for missing)
+        self.memPool = MemPool()
 
-        self.peers = set()
-        self.memPool = []
-        self.blocks = {}
+        # blocks, headers and the tx index live on disk in dataDir when given, otherwise in memory
+        self.dataDir = dataDir
+        self.blocks = {} if dataDir is None else BlockStore(dataDir)
+
+        # keep only the bodies of the most recent pruneDepth blocks, None keeps everything.
+        # with a dataDir bodies after the last snapshot are kept too, a restart replays them
+        if pruneDepth is not None and pruneDepth < 1:
+            raise ValueError("Prune depth must keep at least the tip block.")
+        self.pruneDepth = pruneDepth
+
+        # signatures already verified, so txs seen in the mempool are not checked again in blocks
+        self.signatureCache = SignatureCache()
 
         # hardcode the first block into client nodes
         genesis = GenesisBlock()
         self.blocks[genesis.blockHeader.blockHash()] = genesis
 
+        # heights, parent links and best tip of the connected blocks
+        self.blockIndex = BlockIndex(genesis.blockHeader, self.dataPath(HEADERS_FILE))
+        self.orphanBlocks = OrphanPool()
 
-    def __str__(self):
-        return self.nodeType + " Node: " + self.label or self.address
+        # where every stored tx is, None on memory constrained nodes
+        self.txIndex = TxIndex(self.dataPath(TX_INDEX_FILE)) if txIndex else None
+        self.indexBlockTxs(genesis)
 
+        # unspent outputs as of utxoTip, with undo records for every connected block
+        self.utxoSet = UtxoSet()
+        self.undoData = {genesis.blockHeader.blockHash(): self.utxoSet.connectBlock(genesis)}
+        self.utxoTip = self.blockIndex.genesis
 
-    def __repr__(self):
-        return self.__str__()
+        # hashes of the blocks from utxoTip back to genesis, whose txs are confirmed
+        self.connectedBlocks = {self.utxoTip.blockHash}
 
+        # reconnect blocks stored by a previous run, starting from the last snapshot
+        self.blocksSinceSnapshot = 0
+        self.snapshotTip = None
+        if dataDir is not None:
+            self.loadSnapshot()
+            self.loadStoredBlocks()
 
-    def transfer(self, amount, address):
-        uTxs = []
-        total = 0
 
-        for (tx, i) in self.unspentOutputs():
-            total += tx.outputs[i].amount
-            uTxs.append((tx, i))
+    def loadStoredBlocks(self):
+        """index stored blocks the header log does not know (a crash between
+        storing a block and indexing it), then bring the utxo set from the
+        snapshot tip up to the best tip. blocks are stored in the order they
+        were received so parents come first"""
 
-            if total >= amount:
-                break
+        for blockHash in self.blocks:
+            if blockHash in self.blockIndex:
+                continue
+
+            block = self.blocks[blockHash]
+            self.indexBlockTxs(block)
+            self.blockIndex.add(block.blockHeader)
+
+        self.updateChainState()
+
+
+    def dataPath(self, fileName):
+        if self.dataDir is None:
+            return None
+        return os.path.join(self.dataDir, fileName)
+
+
+    def snapshotPath(self):
+        return self.dataPath(SNAPSHOT_FILE)
+
+
+    @synchronized
+    def writeSnapshot(self):
+        if self.dataDir is None:
+            raise ValueError("Only nodes with a data directory can write snapshots.")
+
+        # undo records of the most recent blocks, enough for ordinary reorgs
+        undoData = {}
+        for entry in self.blockIndex.chain(self.utxoTip)[:SNAPSHOT_UNDO_DEPTH]:
+            if entry.blockHash in self.undoData:
+                undoData[entry.blockHash] = self.undoData[entry.blockHash]
+
+        snapshot = Snapshot(self.utxoTip.blockHash, list(self.utxoSet.outputs.items()), undoData)
+        writeSnapshot(self.snapshotPath(), snapshot)
+        self.blocksSinceSnapshot = 0
+        self.snapshotTip = self.utxoTip
+
+
+    def loadSnapshot(self):
+        if not os.path.exists(self.snapshotPath()):
+            return
+
+        try:
+            snapshot = readSnapshot(self.snapshotPath())
+        except (OSError, ValueError):
+            return # unreadable snapshots fall back to replaying every block
+
+        # headers come from the header log, the tip's body may have been pruned since
+        utxoTip = self.blockIndex.get(snapshot.tipHash)
+        if utxoTip is None:
+            return
+
+        self.utxoSet = UtxoSet()
+        for (outpoint, txOut) in snapshot.utxos:
+            self.utxoSet.add(outpoint, txOut)
+
+        self.undoData = snapshot.undoData
+        self.utxoTip = utxoTip
+        self.connectedBlocks = set(entry.blockHash for entry in self.blockIndex.chain(utxoTip))
+        self.snapshotTip = utxoTip
+
+
+    def broadcast(self, method, payload, kind=INV_BLOCK):
+        """call method(payload) on every peer, through the message bus if there is one"""
+
+        for peer in self.peers:
+            self.sendTo(peer, method, payload, kind)
+        self.flushMessages()
+
+
+    def knownInventory(self, peer):
+        if peer not in self.peerInventory:
+            self.peerInventory[peer] = RecentSet()
+        return self.peerInventory[peer]
+
+
+    def relay(self, kind, obj, objHash):
+        if not self.inventoryRelay:
+            self.broadcast("receiveTx" if kind == INV_TX else "receiveBlock", obj, kind)
+            return
+
+        if kind == INV_BLOCK and self.compactBlocks:
+            method = "receiveCompactBlock"
+            payload = (self, CompactBlock.fromBlock(obj))
+        else:
+            method = "receiveInv"
+            payload = (self, kind, objHash)
+
+        # announce to every peer not already known to have it
+        for peer in self.peers:
+            known = self.knownInventory(peer)
+            if objHash in known:
+                continue
+
+            known.add(objHash)
+            self.sendTo(peer, method, payload, kind)
+        self.flushMessages()
+
+
+    def hasInventory(self, kind, objHash):
+        if kind == INV_TX:
+            return objHash in self.memPool or self.findTx(objHash) is not None
+        return self.hasBlock(objHash)
+
+
+    def oldestServedHeight(self):
+        """height of the oldest best chain block whose body we still have"""
+
+        if self.pruneDepth is None:
+            return 0
+        return max(0, self.blockHeight() - self.pruneDepth + 1)
+
+
+    def hasBlock(self, blockHash):
+        """whether the block is connected, its body may have been pruned since"""
+        return blockHash in self.blockIndex
+
+
+    def getInventory(self, kind, objHash):
+        if kind == INV_TX:
+            tx = self.memPool.get(objHash)
+            return tx if tx is not None else self.findTx(objHash)
+        return self.blocks.get(objHash)
+
+
+    @synchronized
+    def receiveInv(self, message):
+        (peer, kind, objHash) = message
+        self.knownInventory(peer).add(objHash)
+
+        if objHash in self.requested or self.hasInventory(kind, objHash):
+            return
+
+        self.requested.add(objHash, peer)
+        self.sendTo(peer, "receiveGetData", (self, kind, objHash), kind)
+        self.flushMessages()
+
+
+    @synchronized
+    def receiveGetData(self, message):
+        (peer, kind, objHash) = message
+
+        obj = self.getInventory(kind, objHash)
+        if obj is None:
+            self.sendTo(peer, "receiveNotFound", objHash, kind)
+        else:
+            self.sendTo(peer, "receiveTx" if kind == INV_TX else "receiveBlock", obj, kind)
+        self.flushMessages()
+
+
+    @synchronized
+    def receiveCompactBlock(self, message):
+        (peer, compactBlock) = message
+        blockHash = compactBlock.blockHeader.blockHash()
+        self.knownInventory(peer).add(blockHash)
+
+        if self.hasBlock(blockHash) or blockHash in self.orphanBlocks or blockHash in self.partialBlocks:
+            return
+
+        transactions = compactBlock.reconstruct(self.memPool)
+        missing = [i for (i, tx) in enumerate(transactions) if tx is None]
+
+        if missing:
+            # one round trip for the txs our mempool lacks
+            self.partialBlocks[blockHash] = (compactBlock, transactions)
+            self.sendTo(peer, "receiveGetBlockTxs", (self, blockHash, missing))
+            self.flushMessages()
+            return
+
+        self.completeCompactBlock(peer, compactBlock, transactions)
+
+
+    @synchronized
+    def receiveGetBlockTxs(self, message):
+        (peer, blockHash, indexes) = message
+
+        block = self.blocks.get(blockHash)
+        if block is None:
+            self.sendTo(peer, "receiveNotFound", blockHash)
         else:
-            raise ValueError("Wallet dose not have enough spendable outputs for transfer.")
+            self.sendTo(peer, "receiveBlockTxs", (self, blockHash, [block.transactions[i] for i in indexes]))
+        self.flushMessages()
+
 
-        txIns = []
-        for (tx, i) in uTxs:
-            txIn = TxIn(tx.toHash(), i)
-            txIn.setScriptSig(generateSignature(txIn.toBytes(), self.privateKey), self.publicKey)
-            txIns.append(txIn)
+    @synchronized
+    def receiveBlockTxs(self, message):
+        (peer, blockHash, txs) = message
 
-        txOuts = [TxOut(amount, address)]
+        partial = self.partialBlocks.pop(blockHash, None)
+        if partial is None:
+            return
 
-        change = total - amount
-        if change > 0:
-            txOuts.append(TxOut(change, self.address))
+        (compactBlock, transactions) = partial
+        missing = [i for (i, tx) in enumerate(transactions) if tx is None]
+        if len(missing) != len(txs):
+            return
 
-        self.receiveTx(Tx(txIns, txOuts))
+        for (i, tx) in zip(missing, txs):
+            transactions[i] = tx
 
+        self.completeCompactBlock(peer, compactBlock, transactions)
 
-    def addPeer(self, peer):
-        self.peers.add(peer)
 
+    def completeCompactBlock(self, peer, compactBlock, transactions):
+        block = Block(transactions, compactBlock.blockHeader)
 
+        # a short id collision picked the wrong tx, fall back to the full block
+        if block.merkleRoot() != compactBlock.blockHeader.merkleRoot:
+            blockHash = compactBlock.blockHeader.blockHash()
+            self.requested.add(blockHash, peer)
+            self.sendTo(peer, "receiveGetData", (self, INV_BLOCK, blockHash))
+            self.flushMessages()
+            return
+
+        self.receiveBlock(block)
+
+
+    @synchronized
+    def receiveNotFound(self, objHash):
+        # allow asking another peer for it
+        self.requested.discard(objHash)
+        self.partialBlocks.pop(objHash, None)
+
+
+    @synchronized
     def receiveTx(self, tx):
+        self.requested.discard(tx.toHash())
+
+        # check if tx is already in memPool
+        if tx.toHash() in self.memPool:
+            return
+
         # check if the received tx is valid, if not we can discard it
         if not self.verifyTx(tx):
             return
 
         # check if the tx is already in the blockchain
-        for (_, block) in self.blocks.items():
-            for blockTx in block.transactions:
-                if blockTx.toHash() == tx.toHash():
-                    return
-
-        # check if tx is already in memPool
-        if tx in self.memPool:
+        if self.findTx(tx.toHash()) is not None:
             return
 
-        self.memPool.append(tx)
+        # txs double spending one already in the pool are dropped
+        if not self.memPool.add(tx):
+            return
 
-        for peer in self.peers:
-            peer.receiveTx(tx)
+        self.relay(INV_TX, tx, tx.toHash())
 
 
+    @synchronized
     def receiveBlock(self, block):
+        blockHash = block.blockHeader.blockHash()
+        self.requested.discard(blockHash)
+
         # if block is already known we dont need to rebroadcast it
-        if block.blockHeader.blockHash() in self.blocks:
+        if self.hasBlock(blockHash) or blockHash in self.orphanBlocks:
             return
 
-        # add block to our lookup
-        self.blocks[block.blockHeader.blockHash()] = block
+        # hold blocks with an unknown parent until the parent arrives
+        if block.blockHeader.prevBlockHash not in self.blockIndex:
+            self.orphanBlocks.add(block)
+            return
 
-        # remove transactions from mempool that were added to
+        accepted = []
+        pending = [block]
+
+        while pending:
+            block = pending.pop()
+
+            # discard invalid blocks
+            if not self.verifyBlock(block):
+                continue
+
+            # add block to our lookup
+            blockHash = block.blockHeader.blockHash()
+            # index the txs before the header, so a logged header implies indexed txs
+            self.blocks[blockHash] = block
+            self.indexBlockTxs(block)
+            self.blockIndex.add(block.blockHeader)
+            accepted.append(block)
+
+            # orphans waiting on this block can be connected now
+            pending.extend(self.orphanBlocks.popChildren(blockHash))
+
+        # move the utxo set to the best tip, this may invalidate blocks
+        self.updateChainState()
+
+        for block in accepted:
+            blockHash = block.blockHeader.blockHash()
+            if self.hasBlock(blockHash):
+                self.relay(INV_BLOCK, block, blockHash)
+
+
+    def updateChainState(self):
+        """reorganise the utxo set onto the best tip of the block index
+
+        blocks that fail to connect (double spends) are removed together with
+        every block built on them and the next best tip is tried instead,
+        the mempool drops connected txs and takes back those of disconnected blocks"""
+
+        disconnectedTxs = []
+
+        while self.utxoTip is not self.blockIndex.tip:
+            newTip = self.blockIndex.tip
+            fork = self.blockIndex.findFork(self.utxoTip, newTip)
+
+            entry = self.utxoTip
+            while entry is not fork and entry.blockHash in self.undoData and entry.blockHash in self.blocks:
+                entry = entry.parent
+
+            if entry is not fork and self.pruneDepth is not None:
+                # pruned nodes cannot reorg below the bodies they kept, reject the other branch
+                entry = newTip
+                while entry.parent is not fork:
+                    entry = entry.parent
+                self.invalidateBlock(entry)
+                continue
+
+            if entry is not fork:
+                # reorg deeper than the undo records kept, rebuild from genesis
+                self.resetChainState()
+                fork = self.blockIndex.genesis
+
+            while self.utxoTip is not fork:
+                undo = self.undoData.pop(self.utxoTip.blockHash)
+                block = self.blocks[self.utxoTip.blockHash]
+                self.utxoSet.disconnectBlock(block, undo)
+                disconnectedTxs.extend(tx for tx in block.transactions if not isinstance(tx, TxReward))
+                self.connectedBlocks.discard(self.utxoTip.blockHash)
+                self.utxoTip = self.utxoTip.parent
+
+            path = []
+            entry = newTip
+            while entry is not fork:
+                path.append(entry)
+                entry = entry.parent
+
+            for entry in reversed(path):
+                block = self.blocks[entry.blockHash]
+                try:
+                    self.undoData[entry.blockHash] = self.utxoSet.connectBlock(block)
+                except ValueError:
+                    self.invalidateBlock(entry)
+                    break
 
-        for peer in self.peers:
-            peer.receiveBlock(block)
+                # remove transactions from mempool that were added to the chain
+                self.memPool.removeBlock(block)
+                self.connectedBlocks.add(entry.blockHash)
+                self.utxoTip = entry
+                self.blocksSinceSnapshot += 1
 
+        for tx in disconnectedTxs:
+            if self.verifyTx(tx):
+                self.memPool.add(tx)
 
-    def currentBlockChain(self):
-        currentBlock = self.latestBlock()
-        result = []
+        self.prune()
 
-        while currentBlock is not None:
-            result.append(currentBlock)
+        if self.dataDir is not None and self.blocksSinceSnapshot >= SNAPSHOT_INTERVAL:
+            self.writeSnapshot()
 
-            prevBlockHash = currentBlock.blockHeader.prevBlockHash
-            if int(prevBlockHash.hex(), base=16) == 0:
-                break
 
-            currentBlock = self.blocks[prevBlockHash]
+    def invalidateBlock(self, entry):
+        """forget a block and every block built on it"""
 
-        return result
+        for removed in self.blockIndex.invalidate(entry):
+            block = self.blocks.get(removed.blockHash)
+            if block is not None:
+                self.unindexBlockTxs(block)
+                del self.blocks[removed.blockHash]
 
 
-    def latestBlock(self):
-        currentHead = None
-        currentHeadLen = 0
+    def prune(self):
+        """drop the bodies, tx index entries and undo records of best chain
+        blocks deeper than pruneDepth, their headers stay in the block index.
+        the hardcoded genesis block is always kept"""
 
-        for (blockHash, block) in self.blocks.items():
+        if self.pruneDepth is None:
+            return
 
-            tempHead = block
-            tempHeadLen = 0
+        entry = self.utxoTip
+        for _ in range(self.pruneDepth):
+            entry = entry.parent
+            if entry is None:
+                return
 
-            while True:
-                tempHeadLen += 1
+        # a restart replays the bodies after the last snapshot, so only those at or
+        # below it can go. snapshots keep their SNAPSHOT_INTERVAL cadence rather than
+        # rewriting the whole utxo set every pruneDepth blocks
+        if self.dataDir is not None and not self.snapshotCovers(entry):
+            if self.snapshotTip is None or self.snapshotTip.blockHash not in self.connectedBlocks:
+                return
+            entry = self.snapshotTip
 
-                prevBlockHash = tempHead.blockHeader.prevBlockHash
-                if int(prevBlockHash.hex(), base=16) == 0:
-                    break
+        # stop at the first block pruned earlier
+        while entry.parent is not None and entry.blockHash in self.blocks:
+            block = self.blocks[entry.blockHash]
+            self.unindexBlockTxs(block)
+            del self.blocks[entry.blockHash]
+            self.undoData.pop(entry.blockHash, None)
+
+            entry = entry.parent
+
+
+    def snapshotCovers(self, entry):
+        """whether the last snapshot is at or above entry on the connected chain"""
+
+        if self.snapshotTip is None or self.snapshotTip.blockHash not in self.connectedBlocks:
+            return False
+        return self.snapshotTip.height >= entry.height
+
+
+    def resetChainState(self):
+        """utxo set back to just the genesis block"""
+
+        genesis = self.blockIndex.genesis
+        self.utxoSet = UtxoSet()
+        self.undoData = {genesis.blockHash: self.utxoSet.connectBlock(self.blocks[genesis.blockHash])}
+        self.utxoTip = genesis
+        self.connectedBlocks = {genesis.blockHash}
+
+
+    # headers first synchronisation
+
+    def blockLocator(self):
+        return self.blockIndex.locator()
+
+
+    @synchronized
+    def getHeaders(self, locator, maxHeaders=MAX_HEADERS):
+        return self.blockIndex.headersAfter(locator, maxHeaders)
+
+
+    def checkHeaders(self, headers):
+        return self.blockIndex.checkHeaders(headers)
+
+
+    @synchronized
+    def synchronize(self):
+        """catch up with our peers: fetch and check their header chains first,
+        then request the missing bodies spread across every peer serving them,
+        out of order bodies wait in the orphan pool. returns blocks requested"""
+
+        requested = 0
+
+        while True:
+            locator = self.blockLocator()
+
+            best = []
+            serving = {}
+            for peer in self.peers:
+                headers = peer.getHeaders(locator)
+                if not self.checkHeaders(headers):
+                    continue
+
+                if len(headers) > len(best):
+                    best = headers
+
+                # pruned peers only serve their most recent bodies
+                if headers:
+                    height = self.blockIndex.get(headers[0].prevBlockHash).height + 1
+                    oldest = peer.oldestServedHeight()
+                    serving[peer] = set(header.blockHash() for (i, header) in enumerate(headers) if height + i >= oldest)
 
-                tempHead = self.blocks[prevBlockHash]
+            missing = [header.blockHash() for header in best if not self.hasBlock(header.blockHash())]
+            if not missing:
+                return requested
 
-            if tempHeadLen > currentHeadLen:
-                currentHead = block
-                currentHeadLen = tempHeadLen
+            for (i, blockHash) in enumerate(missing):
+                peers = [peer for (peer, hashes) in serving.items() if blockHash in hashes]
+                if not peers:
+                    continue
+                peer = peers[i % len(peers)]
 
-        return currentHead
+                self.requested.add(blockHash, peer)
+                self.sendTo(peer, "receiveGetData", (self, INV_BLOCK, blockHash))
+                requested += 1
 
+            self.flushMessages()
+
+            # stop if the peers did not deliver, rather than asking forever
+            if any(not self.hasBlock(blockHash) for blockHash in missing):
+                return requested
+
+
+    @synchronized
+    def currentBlockChain(self):
+        """blocks from the tip back to genesis, on pruned nodes only back to the oldest kept body"""
+
+        result = []
+        for entry in self.blockIndex.chain():
+            block = self.blocks.get(entry.blockHash)
+            if block is None:
+                break
+            result.append(block)
+
+        return result
+
+
+    @synchronized
+    def latestBlock(self):
+        return self.blocks[self.blockIndex.tip.blockHash]
 
 
     def verifyTx(self, tx):
+        """check a loose tx against the current chain, every input must spend an unspent output"""
+
+        spent = set()
         for txIn in tx.inputs:
-            prevTx = None
+            outpoint = (txIn.prevTxHash, txIn.prevTxOutIndex)
+
+            # check if the outputs have already been used as inputs (double spend)
+            if outpoint in spent or outpoint not in self.utxoSet:
+                return False
+            spent.add(outpoint)
+
+        return self.verifyScripts(tx, self.utxoSet.get)
+
+
+    def verifyScripts(self, tx, findOutput):
+        """check every input is signed by the owner of the output it spends,
+        findOutput maps an outpoint to its TxOut or None"""
+
+        signatureChecks = self.scriptChecks(tx, findOutput)
+        if signatureChecks is None:
+            return False
+
+        return self.verifySignatureChecks(signatureChecks, processes=1)
+
+
+    def scriptChecks(self, tx, findOutput):
+        """signature checks still needed for tx's inputs, or None if an input
+        does not spend a known output paying to its public key"""
 
-            # find referenced tx
-            for (_, block) in self.blocks.items():
-                for tx in block.transactions:
-                    if txIn.prevTxHash == tx.toHash():
-                        prevTx = tx
-                        break
+        signatureChecks = []
+
+        for txIn in tx.inputs:
+            prevOutput = findOutput((txIn.prevTxHash, txIn.prevTxOutIndex))
+            if prevOutput is None:
+                return None
 
-            prevOutput = prevTx.outputs[txIn.prevTxOutIndex]
             intenedAddress = prevOutput.address
 
             sig = txIn.signature
@@ -167,59 +631,165 @@ class Node(object):
 
             # check intenedAddress of previous output equals address in input
             if pkAddress != intenedAddress:
-                return False
+                return None
 
-            # check the signature verifies the owner of the public key
-            if not verifySignature(txIn.toBytes(), sig, publicKey):
-                return False
+            # signatures are checked together once every input has been looked up
+            check = (txIn.toBytes(), sig, publicKey)
+            if not self.signatureCache.contains(SignatureCache.key(*check)):
+                signatureChecks.append(check)
 
-            # check if the outputs have already been used as inputs (double spend)
-            # TODO: ...
+        return signatureChecks
 
-        return True
 
+    def verifySignatureChecks(self, signatureChecks, processes=None):
+        """check the signatures verify the owners of the public keys, caching the valid ones"""
 
-    def unspentOutputs(self):
-        """returns an array of tuples of (tx, outputIndex)"""
-        result = []
+        results = verifySignatures(signatureChecks, processes=processes)
+        for (check, valid) in zip(signatureChecks, results):
+            if valid:
+                self.signatureCache.add(SignatureCache.key(*check))
 
-        for block in self.currentBlockChain():
-            for tx in block.transactions:
-                for output in tx.outputs:
+        return all(results)
 
-                    # find all outputs that are sent to our address
-                    if output.address != self.address:
-                        continue
 
-                    # to find out if the coin has been spent in following blocks
-                    # check if its been used as an input
+    def findOutput(self, outpoint):
+        """output from the utxo set, or from any known block for txs on other branches"""
 
-                    unspent = True
+        txOut = self.utxoSet.get(outpoint)
+        if txOut is not None:
+            return txOut
 
-                    for futureBlock in self.currentBlockChain():
-                        for futureTx in futureBlock.transactions:
-                            for txIn in futureTx.inputs:
-                                if txIn.prevTxHash == tx.toHash() and tx.outputs[txIn.prevTxOutIndex] == output:
-                                    unspent = False
+        (txHash, i) = outpoint
+        tx = self.findBlockTx(txHash)
+        if tx is None or i >= len(tx.outputs):
+            return None
 
-                        # we dont need to check past here
-                        if futureBlock.blockHeader.blockHash() == block.blockHeader.blockHash():
-                            break
+        return tx.outputs[i]
 
-                    if unspent:
-                        result.append((tx, tx.outputs.index(output)))
 
-        return result
+    def indexBlockTxs(self, block):
+        if self.txIndex is not None:
+            self.txIndex.addBlock(block)
 
 
-    def spendableAmount(self):
-        result = 0
+    def unindexBlockTxs(self, block):
+        if self.txIndex is not None:
+            self.txIndex.removeBlock(block)
 
-        for (tx, i) in self.unspentOutputs():
-            result += tx.outputs[i].amount
-        return result
+
+    def locateTx(self, txHash):
+        """(blockHash, position) of a tx in a stored block connected to the utxo set, or None"""
+
+        if self.txIndex is not None:
+            # copies in blocks on other branches are not confirmed
+            for (blockHash, position) in self.txIndex.get(txHash):
+                if blockHash in self.connectedBlocks and blockHash in self.blocks:
+                    return (blockHash, position)
+            return None
+
+        # no index, scan the stored blocks of the connected chain
+        for entry in self.blockIndex.chain(self.utxoTip):
+            block = self.blocks.get(entry.blockHash)
+            if block is None:
+                break
+
+            for (position, blockTx) in enumerate(block.transactions):
+                if blockTx.toHash() == txHash:
+                    return (entry.blockHash, position)
+
+        return None
+
+
+    @synchronized
+    def findTx(self, txHash):
+        """confirmed tx with the given hash, or None"""
+
+        location = self.locateTx(txHash)
+        if location is None:
+            return None
+
+        (blockHash, position) = location
+        return self.blocks[blockHash].transactions[position]
+
+
+    def findBlockTx(self, txHash):
+        """tx with the given hash from any stored block, on any branch, or None"""
+
+        if self.txIndex is not None:
+            for (blockHash, position) in self.txIndex.get(txHash):
+                block = self.blocks.get(blockHash)
+                if block is not None:
+                    return block.transactions[position]
+            return None
+
+        # no index, scan every block
+        for (_, block) in self.blocks.items():
+            for blockTx in block.transactions:
+                if blockTx.toHash() == txHash:
+                    return blockTx
+
+        return None
+
+
+    # serving light nodes
+
+    @synchronized
+    def getTxProof(self, txHash):
+        """(tx, blockHash, position, merkle branch) for a confirmed tx, or None"""
+
+        location = self.locateTx(txHash)
+        if location is None:
+            return None
+
+        (blockHash, position) = location
+        block = self.blocks[blockHash]
+        return (block.transactions[position], blockHash, position, block.merkleBranch(position))
+
+
+    @synchronized
+    def getUnspentOutputs(self, address):
+        """(outpoint, txOut) of every unspent output paying to address"""
+        return self.utxoSet.outputsFor(address)
+
+
+    def verifyBlock(self, block):
+        if not block.blockHeader.meetsTarget():
+            return False
+
+        if block.blockHeader.merkleRoot != block.merkleRoot():
+            return False
+
+        # every uncached signature in the block is verified in one batch
+        signatureChecks = []
+        for tx in block.transactions:
+            if isinstance(tx, TxReward):
+                continue
+
+            # spending is checked when the block is connected to the utxo set
+            checks = self.scriptChecks(tx, self.findOutput)
+            if checks is None:
+                return False
+            signatureChecks.extend(checks)
+
+        return self.verifySignatureChecks(signatureChecks)
+
+
+    @synchronized
+    def unspentOutputs(self):
+        """returns an array of tuples of (outpoint, txOut) paying to our address"""
+        return self.utxoSet.outputsFor(self.address)
+
+
+    def spendableOutputs(self):
+        # skip outputs already spent by our own unconfirmed txs
+        return [(outpoint, txOut) for (outpoint, txOut) in self.unspentOutputs() if not self.memPool.isSpent(outpoint)]
+
+
+    def submitTx(self, tx):
+        self.receiveTx(tx)
 
 
+@synchronized
 def connect(nodeA, nodeB):
     nodeA.addPeer(nodeB)
     nodeB.addPeer(nodeA)
@@ -0,0 +1,53 @@
+import os
+
+
+class RecordLog(object):
+    """append only file of fixed size records, replayed in order on open
+
+    read the records before appending, a torn final record left by a crash
+    is cut off then so the records appended after it stay aligned"""
+
+    def __init__(self, path, recordSize):
+        self.path = path
+        self.recordSize = recordSize
+        self.file = None
+
+
+    def records(self):
+        """every complete record in the log, as memoryviews"""
+
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        usable = len(data) - len(data) % self.recordSize
+        if usable < len(data):
+            os.truncate(self.path, usable)
+
+        view = memoryview(data)
+        return [view[offset:offset + self.recordSize] for offset in range(0, usable, self.recordSize)]
+
+
+    def append(self, record, flush=True):
+        if len(record) != self.recordSize:
+            raise ValueError("Log record is {} bytes, expected {}.".format(len(record), self.recordSize))
+
+        if self.file is None:
+            self.file = open(self.path, "ab")
+
+        self.file.write(record)
+        if flush:
+            self.file.flush()
+
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from hashlib import sha256
+
+SIGNATURE_CACHE_SIZE = 50000
+
+class SignatureCache(object):
+    """bounded set of (sighash, publicKey, signature) triples known to verify,
+    least recently used entries are evicted first"""
+
+    def __init__(self, maxSize=SIGNATURE_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    @staticmethod
+    def key(messageBytes, signature, publicKey):
+        return (sha256(messageBytes).digest(), publicKey, tuple(signature))
+
+
+    def contains(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+
+    def add(self, key):
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
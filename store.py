@@ -0,0 +1,177 @@
+import os
+import mmap
+from collections import OrderedDict
+
+from recordlog import RecordLog
+from wire import encodeBlock, decodeBlock
+
+SEGMENT_SIZE = 16 * 1024 * 1024 # bytes per segment file before starting a new one
+BLOCK_CACHE_SIZE = 64 # decoded blocks kept in memory
+
+INDEX_FILE = "index.dat"
+SEGMENT_FILE = "blk{:05d}.dat"
+
+# index records: operation, block hash, segment, offset, length
+INDEX_ADD = 1
+INDEX_REMOVE = 0
+INDEX_RECORD_SIZE = 1 + 32 + 4 + 8 + 4
+
+
+class BlockStore(object):
+    """append only block storage usable in place of a dict of blockHash -> block
+
+    serialized blocks are appended to segment files, an append only index
+    file maps each hash to (segment, offset, length) and is replayed on open,
+    bodies are decoded lazily from memory mapped segments with only a small
+    cache of recently used blocks kept in memory"""
+
+    def __init__(self, directory, segmentSize=SEGMENT_SIZE, cacheSize=BLOCK_CACHE_SIZE):
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.cacheSize = cacheSize
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.locations = OrderedDict() # blockHash -> (segment, offset, length) in append order
+        self.cache = OrderedDict()
+        self.maps = {} # segment -> mmap
+
+        self.indexLog = RecordLog(os.path.join(directory, INDEX_FILE), INDEX_RECORD_SIZE)
+        self.loadIndex()
+
+        self.segment = max([segment for (segment, _, _) in self.locations.values()] + [0])
+        self.segmentFile = open(self.segmentPath(self.segment), "ab")
+
+
+    def segmentPath(self, segment):
+        return os.path.join(self.directory, SEGMENT_FILE.format(segment))
+
+
+    def loadIndex(self):
+        for record in self.indexLog.records():
+            blockHash = bytes(record[1:33])
+
+            if record[0] == INDEX_ADD:
+                segment = int.from_bytes(record[33:37], 'big')
+                blockOffset = int.from_bytes(record[37:45], 'big')
+                length = int.from_bytes(record[45:49], 'big')
+                self.locations[blockHash] = (segment, blockOffset, length)
+            else:
+                self.locations.pop(blockHash, None)
+
+
+    def writeIndexRecord(self, operation, blockHash, segment=0, offset=0, length=0):
+        record = bytes((operation,)) + blockHash + segment.to_bytes(4, 'big') + \
+            offset.to_bytes(8, 'big') + length.to_bytes(4, 'big')
+        self.indexLog.append(record)
+
+
+    def close(self):
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps = {}
+
+        self.segmentFile.close()
+        self.indexLog.close()
+
+
+    # dict interface
+
+    def __contains__(self, blockHash):
+        return blockHash in self.locations
+
+
+    def __len__(self):
+        return len(self.locations)
+
+
+    def __iter__(self):
+        return iter(list(self.locations))
+
+
+    def keys(self):
+        return list(self.locations)
+
+
+    def items(self):
+        return ((blockHash, self[blockHash]) for blockHash in list(self.locations))
+
+
+    def values(self):
+        return (block for (_, block) in self.items())
+
+
+    def get(self, blockHash, default=None):
+        if blockHash not in self.locations:
+            return default
+        return self[blockHash]
+
+
+    def __getitem__(self, blockHash):
+        block = self.cache.get(blockHash)
+        if block is not None:
+            self.cache.move_to_end(blockHash)
+            return block
+
+        (segment, offset, length) = self.locations[blockHash]
+        view = memoryview(self.mapSegment(segment, offset + length))
+        try:
+            block = decodeBlock(view[offset:offset + length])
+        finally:
+            view.release()
+
+        self.cacheBlock(blockHash, block)
+        return block
+
+
+    def __setitem__(self, blockHash, block):
+        if blockHash in self.locations:
+            return # blocks are immutable, a hash always maps to the same block
+
+        data = encodeBlock(block)
+
+        offset = self.segmentFile.tell()
+        if offset > 0 and offset + len(data) > self.segmentSize:
+            self.segmentFile.close()
+            self.segment += 1
+            self.segmentFile = open(self.segmentPath(self.segment), "ab")
+            offset = 0
+
+        self.segmentFile.write(data)
+        self.segmentFile.flush()
+
+        self.writeIndexRecord(INDEX_ADD, blockHash, self.segment, offset, len(data))
+        self.locations[blockHash] = (self.segment, offset, len(data))
+        self.cacheBlock(blockHash, block)
+
+
+    def __delitem__(self, blockHash):
+        # the body stays in its segment, only the index forgets it
+        del self.locations[blockHash]
+        self.cache.pop(blockHash, None)
+        self.writeIndexRecord(INDEX_REMOVE, blockHash)
+
+
+    def cacheBlock(self, blockHash, block):
+        self.cache[blockHash] = block
+        self.cache.move_to_end(blockHash)
+
+        while len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+
+
+    def mapSegment(self, segment, size):
+        """mmap of the segment covering at least size bytes, remapped as the segment grows"""
+
+        mapped = self.maps.get(segment)
+        if mapped is not None and len(mapped) >= size:
+            return mapped
+
+        if mapped is not None:
+            mapped.close()
+
+        with open(self.segmentPath(segment), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.maps[segment] = mapped
+        return mapped
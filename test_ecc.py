@@ -0,0 +1,107 @@
+import os
+import random
+import tempfile
+import unittest
+
+from ecc import (N, GPoint, LAMBDA, EccAdd, EccDouble, EccMultiply, toJacobian, fromJacobian,
+    jacobianMultiply, glvSplit, glvMultiply, generatorMultiply, doubleScalarMultiply,
+    generatorTable, _saveGeneratorTable, _loadGeneratorTable)
+
+
+def doubleAndAdd(point, scalar):
+    """the original affine double and add, used as the reference"""
+
+    Q = point
+    for bit in bin(scalar)[2:][1:]:
+        Q = EccDouble(Q)
+        if bit == "1":
+            Q = EccAdd(Q, point)
+    return Q
+
+
+# a point other than the generator, so the generator tables are not used
+OTHER_POINT = doubleAndAdd(GPoint, 0xC0FFEE)
+
+EDGE_SCALARS = [1, 2, 3, N - 1, N - 2, 2 ** 128, 2 ** 128 - 1, 2 ** 255, LAMBDA, N - LAMBDA, N // 2]
+
+
+class ScalarMultiplyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(4)
+        self.scalars = EDGE_SCALARS + [self.random.randrange(1, N) for _ in range(16)]
+
+
+    def testGlvSplit(self):
+        for scalar in self.scalars:
+            (k1, k2) = glvSplit(scalar)
+            self.assertEqual((k1 + k2 * LAMBDA) % N, scalar)
+            self.assertLess(abs(k1).bit_length(), 130)
+            self.assertLess(abs(k2).bit_length(), 130)
+
+
+    def testGlvMultiply(self):
+        for scalar in self.scalars:
+            expected = doubleAndAdd(OTHER_POINT, scalar)
+            self.assertEqual(fromJacobian(glvMultiply(toJacobian(OTHER_POINT), scalar)), expected)
+            self.assertEqual(EccMultiply(OTHER_POINT, scalar), expected)
+
+
+    def testGeneratorMultiply(self):
+        for scalar in self.scalars:
+            expected = doubleAndAdd(GPoint, scalar)
+            self.assertEqual(fromJacobian(generatorMultiply(scalar)), expected)
+            self.assertEqual(EccMultiply(GPoint, scalar), expected)
+
+
+    def testDoubleScalarMultiply(self):
+        for (u1, u2) in zip(self.scalars, reversed(self.scalars)):
+            expected = EccAdd(doubleAndAdd(GPoint, u1), doubleAndAdd(OTHER_POINT, u2))
+            result = doubleScalarMultiply(u1, u2, toJacobian(OTHER_POINT))
+            self.assertEqual(fromJacobian(result), expected)
+
+
+    def testJacobianMultiply(self):
+        for scalar in self.scalars[:8]:
+            result = jacobianMultiply(toJacobian(OTHER_POINT), scalar)
+            self.assertEqual(fromJacobian(result), doubleAndAdd(OTHER_POINT, scalar))
+
+
+    def testInvalidScalar(self):
+        for scalar in (0, N):
+            with self.assertRaises(Exception):
+                EccMultiply(GPoint, scalar)
+
+
+class GeneratorTableCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp()
+        os.close(handle)
+        _saveGeneratorTable(generatorTable(), self.path)
+
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+
+
+    def tearDown(self):
+        os.remove(self.path)
+
+
+    def testLoad(self):
+        self.assertEqual(_loadGeneratorTable(self.path), generatorTable())
+
+
+    def testFlippedBit(self):
+        for position in (1, 40, len(self.data) // 2, len(self.data) - 1):
+            data = bytearray(self.data)
+            data[position] ^= 1
+            with open(self.path, "wb") as f:
+                f.write(data)
+
+            with self.assertRaises(ValueError):
+                _loadGeneratorTable(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
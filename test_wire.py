@@ -0,0 +1,160 @@
+import time
+import unittest
+
+from ecc import generateKeyPair, compressPublicKey, generateSignature
+from base58check import encode
+from block import Block, GenesisBlock, UnminedBlock
+from tx import Tx, TxIn, TxOut, TxReward
+from wire import (WIRE_VERSION, encodeTx, decodeTx, encodeBlockHeader, decodeBlockHeader,
+    encodeBlock, decodeBlock)
+
+
+def newAddress():
+    (sk, pk) = generateKeyPair()
+    cpk = compressPublicKey(pk)
+    return (sk, cpk, encode(cpk))
+
+
+def signedTx(prevTxHash, outputs=2):
+    (sk, cpk, address) = newAddress()
+
+    txIn = TxIn(prevTxHash, 1)
+    txIn.setScriptSig(generateSignature(txIn.toBytes(), sk), cpk)
+
+    return Tx([txIn], [TxOut(10 * (i + 1), address) for i in range(outputs)])
+
+
+def minedBlock(transactions, prevBlockHash):
+    unmined = UnminedBlock(list(transactions), prevBlockHash)
+    unmined.addRewardTransaction(newAddress()[2], 1)
+
+    # the wire format does not check proof of work, any nonce will do
+    header = unmined.incompleteBlockHeader()
+    header.setNonce(12345)
+    return Block(unmined.transactions, header)
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def assertTxEqual(self, tx, decoded):
+        self.assertEqual(type(decoded), type(tx))
+        self.assertEqual(decoded.toHash(), tx.toHash())
+        self.assertEqual(encodeTx(decoded), encodeTx(tx))
+
+
+    def testSignedTx(self):
+        tx = signedTx(bytes(range(32)))
+        decoded = decodeTx(encodeTx(tx))
+
+        self.assertTxEqual(tx, decoded)
+        self.assertEqual(decoded.inputs[0].signature, tx.inputs[0].signature)
+        self.assertEqual(decoded.inputs[0].publicKey, tx.inputs[0].publicKey)
+        self.assertEqual([(o.amount, o.address) for o in decoded.outputs], [(o.amount, o.address) for o in tx.outputs])
+
+
+    def testUnsignedTxIn(self):
+        tx = Tx([TxIn(bytes(32), 0)], [TxOut(5, newAddress()[2])])
+        decoded = decodeTx(encodeTx(tx))
+
+        self.assertTxEqual(tx, decoded)
+        self.assertIsNone(decoded.inputs[0].signature)
+        self.assertIsNone(decoded.inputs[0].publicKey)
+
+
+    def testTxRewardExtraNonce(self):
+        tx = TxReward(newAddress()[2], 7, extraNonce=3)
+        decoded = decodeTx(encodeTx(tx))
+
+        self.assertTxEqual(tx, decoded)
+        self.assertEqual((decoded.blockHeight, decoded.extraNonce), (7, 3))
+
+
+    def testBlockHeader(self):
+        header = GenesisBlock().blockHeader
+        decoded = decodeBlockHeader(encodeBlockHeader(header))
+
+        self.assertEqual(decoded.blockHash(), header.blockHash())
+        self.assertTrue(decoded.meetsTarget())
+
+
+    def testGenesisBlock(self):
+        genesis = GenesisBlock()
+        decoded = decodeBlock(encodeBlock(genesis))
+
+        self.assertEqual(decoded.blockHeader.blockHash(), genesis.blockHeader.blockHash())
+        self.assertEqual(decoded.merkleRoot(), genesis.blockHeader.merkleRoot)
+
+
+    def testBlock(self):
+        block = minedBlock([signedTx(bytes([i]) * 32) for i in range(3)], bytes(32))
+        decoded = decodeBlock(encodeBlock(block))
+
+        self.assertEqual(decoded.blockHeader.blockHash(), block.blockHeader.blockHash())
+        self.assertEqual([tx.toHash() for tx in decoded.transactions], [tx.toHash() for tx in block.transactions])
+        self.assertIsInstance(decoded.transactions[0], TxReward)
+
+
+    def testDecodeMemoryview(self):
+        data = bytearray(b'\xff' + encodeTx(signedTx(bytes(32))))
+        tx = decodeTx(memoryview(data)[1:])
+        self.assertEqual(encodeTx(tx), bytes(data[1:]))
+
+
+class MalformedInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [
+            (decodeTx, encodeTx(signedTx(bytes(32)))),
+            (decodeTx, encodeTx(TxReward(newAddress()[2], 1, 2))),
+            (decodeBlockHeader, encodeBlockHeader(GenesisBlock().blockHeader)),
+            (decodeBlock, encodeBlock(GenesisBlock())),
+        ]
+
+
+    def testTruncated(self):
+        for (decoder, data) in self.messages:
+            for size in (0, 1, len(data) // 2, len(data) - 1):
+                with self.assertRaises(ValueError):
+                    decoder(data[:size])
+
+
+    def testTrailingBytes(self):
+        for (decoder, data) in self.messages:
+            with self.assertRaises(ValueError):
+                decoder(data + b'\x00')
+
+
+    def testBadVersion(self):
+        for (decoder, data) in self.messages:
+            with self.assertRaises(ValueError):
+                decoder(bytes((WIRE_VERSION + 1,)) + data[1:])
+
+
+    def testUnknownTxType(self):
+        data = bytearray(encodeTx(signedTx(bytes(32))))
+        data[1] = 0xff
+        with self.assertRaises(ValueError):
+            decodeTx(bytes(data))
+
+
+class ThroughputTest(unittest.TestCase):
+
+    def testBlockThroughput(self):
+        # signing dominates building the block, so reuse one signed tx
+        tx = signedTx(bytes(32))
+        block = minedBlock([tx] * 200, bytes(32))
+
+        start = time.perf_counter()
+        for _ in range(20):
+            decoded = decodeBlock(encodeBlock(block))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(decoded.transactions), 201)
+
+        # 20 blocks of 201 txs, well under a second even on slow machines
+        txsPerSecond = 20 * 201 / elapsed
+        self.assertGreater(txsPerSecond, 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,32 +1,41 @@
-from utility import paddedBytes
+from utility import paddedBytes, HashCached
 from hashlib import sha256
 from base58check import encode
 
 REWARD_AMOUNT = 50
 
-class TxIn(object):
+class TxIn(HashCached):
+
+    __slots__ = ('prevTxHash', 'prevTxOutIndex', 'signature', 'publicKey')
 
     def __init__(self, prevTxHash, prevTxOutIndex):
+        super(TxIn, self).__init__()
         self.prevTxHash = prevTxHash
         self.prevTxOutIndex = prevTxOutIndex
 
+        self.signature = None
+        self.publicKey = None
+
 
     def setScriptSig(self, sig, publicKey):
-        self.signature = sig
-        self.publicKey = publicKey
+        # the scriptSig signs toBytes() so it is not part of it and may be set after hashing, but only once
+        if self.signature is not None:
+            raise AttributeError("TxIn already has a scriptSig.")
 
+        object.__setattr__(self, 'signature', sig)
+        object.__setattr__(self, 'publicKey', publicKey)
 
-    def toBytes(self):
+
+    def _serialize(self):
         return self.prevTxHash + paddedBytes(self.prevTxOutIndex, 4)
 
 
-    def toHash(self):
-        return sha256(self.toBytes()).digest()
+class TxOut(HashCached):
 
-
-class TxOut(object):
+    __slots__ = ('amount', 'address')
 
     def __init__(self, amount, address):
+        super(TxOut, self).__init__()
         self.amount = amount
         self.address = address # ScriptPubKey
 
@@ -39,30 +48,21 @@ class TxOut(object):
         return self.__str__()
 
 
-    def toBytes(self):
+    def _serialize(self):
         return paddedBytes(self.amount, 8) + self.address.encode()
 
 
-    def toHash(self):
-        return sha256(self.toBytes()).digest()
-
+class Tx(HashCached):
 
-class Tx(object):
+    __slots__ = ('inputs', 'outputs')
 
     def __init__(self, inputs, outputs):
-        self.inputs = inputs
-        self.outputs = outputs
+        super(Tx, self).__init__()
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
 
-    def toBytes(self):
-        result = bytes(0)
-        for ba in map(lambda txIn: txIn.toBytes(), self.inputs):
-            result += ba
-        for ba in map(lambda txOut: txOut.toBytes(), self.outputs):
-            result += ba
-        return result
-
-    def toHash(self):
-        return sha256(self.toBytes()).digest()
+    def _serialize(self):
+        return b''.join([txIn.toBytes() for txIn in self.inputs] + [txOut.toBytes() for txOut in self.outputs])
 
     def __str__(self):
         return 'Tx: ' + self.toHash().hex()
@@ -73,10 +73,20 @@ class Tx(object):
 
 class TxReward(Tx):
 
-    def __init__(self, address, blockHeight):
-        self.blockHeight = blockHeight
+    __slots__ = ('blockHeight', 'extraNonce')
+
+    def __init__(self, address, blockHeight, extraNonce=0):
         super(TxReward, self).__init__([], [TxOut(REWARD_AMOUNT, address)])
+        self.blockHeight = blockHeight
+
+        # rolled by miners once the 32 bit header nonce space is exhausted
+        self.extraNonce = extraNonce
 
 
     def toHash(self):
-        return sha256(self.toBytes() + paddedBytes(self.blockHeight)).digest()
+        if self._hash is None:
+            data = self.toBytes() + paddedBytes(self.blockHeight)
+            if self.extraNonce:
+                data += paddedBytes(self.extraNonce, 8)
+            object.__setattr__(self, '_hash', sha256(data).digest())
+        return self._hash
@@ -0,0 +1,102 @@
+from recordlog import RecordLog
+
+TX_INDEX_FILE = "txindex.dat"
+
+# tx index log records: operation, tx hash, block hash, position in the block
+TX_INDEX_ADD = 1
+TX_INDEX_REMOVE = 0
+TX_INDEX_RECORD_SIZE = 1 + 32 + 32 + 4
+
+
+class TxIndex(object):
+    """every stored block a tx appears in, the same tx can be in blocks on
+    several branches so each txHash maps to a list of (blockHash, position)
+
+    given a path, changes are appended to a log file that is replayed on
+    open, so the index is persisted incrementally instead of rewritten"""
+
+    def __init__(self, path=None):
+        self.locations = {} # txHash -> list of (blockHash, position)
+
+        self.log = None
+        if path is not None:
+            self.log = RecordLog(path, TX_INDEX_RECORD_SIZE)
+            self.loadLog()
+
+
+    def __contains__(self, txHash):
+        return txHash in self.locations
+
+
+    def __len__(self):
+        return len(self.locations)
+
+
+    def loadLog(self):
+        for record in self.log.records():
+            txHash = bytes(record[1:33])
+            location = (bytes(record[33:65]), int.from_bytes(record[65:69], 'big'))
+
+            if record[0] == TX_INDEX_ADD:
+                self.addLocation(txHash, location)
+            else:
+                self.removeLocation(txHash, location)
+
+
+    def writeLogRecord(self, operation, txHash, location):
+        if self.log is None:
+            return
+
+        (blockHash, position) = location
+        self.log.append(bytes((operation,)) + txHash + blockHash + position.to_bytes(4, 'big'), flush=False)
+
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+
+    def get(self, txHash):
+        return self.locations.get(txHash, ())
+
+
+    def addLocation(self, txHash, location):
+        locations = self.locations.setdefault(txHash, [])
+        if location in locations:
+            return False
+
+        locations.append(location)
+        return True
+
+
+    def removeLocation(self, txHash, location):
+        locations = self.locations.get(txHash)
+        if locations is None or location not in locations:
+            return False
+
+        locations.remove(location)
+        if not locations:
+            del self.locations[txHash]
+        return True
+
+
+    def addBlock(self, block):
+        blockHash = block.blockHeader.blockHash()
+
+        for (position, tx) in enumerate(block.transactions):
+            if self.addLocation(tx.toHash(), (blockHash, position)):
+                self.writeLogRecord(TX_INDEX_ADD, tx.toHash(), (blockHash, position))
+
+        if self.log is not None:
+            self.log.flush()
+
+
+    def removeBlock(self, block):
+        blockHash = block.blockHeader.blockHash()
+
+        for (position, tx) in enumerate(block.transactions):
+            if self.removeLocation(tx.toHash(), (blockHash, position)):
+                self.writeLogRecord(TX_INDEX_REMOVE, tx.toHash(), (blockHash, position))
+
+        if self.log is not None:
+            self.log.flush()
@@ -2,3 +2,37 @@ from hashlib import sha256
 
 def paddedBytes(x, nBytes=32):
     return x.to_bytes(nBytes, 'big')
+
+
+class HashCached(object):
+    """base for objects whose serialization and hash are computed once and
+    cached, attributes can no longer be assigned after either is computed"""
+
+    __slots__ = ('_bytes', '_hash')
+
+    def __init__(self):
+        object.__setattr__(self, '_bytes', None)
+        object.__setattr__(self, '_hash', None)
+
+
+    def __setattr__(self, name, value):
+        if self._bytes is not None or self._hash is not None:
+            raise AttributeError("{} cannot be modified after it has been hashed.".format(type(self).__name__))
+
+        object.__setattr__(self, name, value)
+
+
+    def _serialize(self):
+        raise NotImplementedError()
+
+
+    def toBytes(self):
+        if self._bytes is None:
+            object.__setattr__(self, '_bytes', self._serialize())
+        return self._bytes
+
+
+    def toHash(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', sha256(self.toBytes()).digest())
+        return self._hash
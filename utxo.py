@@ -0,0 +1,86 @@
+class UtxoSet(object):
+    """unspent outputs of the connected chain, keyed by outpoint (txHash, outputIndex)"""
+
+    def __init__(self):
+        self.outputs = {}
+
+        # address -> set of outpoints paying to it, for wallet lookups
+        self.addressIndex = {}
+
+
+    def __contains__(self, outpoint):
+        return outpoint in self.outputs
+
+
+    def __len__(self):
+        return len(self.outputs)
+
+
+    def get(self, outpoint):
+        return self.outputs.get(outpoint)
+
+
+    def add(self, outpoint, txOut):
+        self.outputs[outpoint] = txOut
+        self.addressIndex.setdefault(txOut.address, set()).add(outpoint)
+
+
+    def remove(self, outpoint):
+        txOut = self.outputs.pop(outpoint)
+
+        outpoints = self.addressIndex[txOut.address]
+        outpoints.discard(outpoint)
+        if not outpoints:
+            del self.addressIndex[txOut.address]
+
+        return txOut
+
+
+    def outputsFor(self, address):
+        """list of (outpoint, txOut) paying to address"""
+        return [(outpoint, self.outputs[outpoint]) for outpoint in self.addressIndex.get(address, ())]
+
+
+    def connectBlock(self, block):
+        """apply the block's transactions, returns the undo record (the spent outputs in order)
+
+        raises ValueError and leaves the set unchanged if the block spends a
+        missing output or recreates an existing one"""
+
+        undo = []
+
+        for (position, tx) in enumerate(block.transactions):
+            txHash = tx.toHash()
+            spent = [(txIn.prevTxHash, txIn.prevTxOutIndex) for txIn in tx.inputs]
+
+            valid = len(set(spent)) == len(spent) and all(outpoint in self.outputs for outpoint in spent)
+            valid = valid and all((txHash, i) not in self.outputs for i in range(len(tx.outputs)))
+
+            if not valid:
+                self._revert(block.transactions[:position], undo)
+                raise ValueError("Block spends a missing output or recreates an existing one.")
+
+            for outpoint in spent:
+                undo.append((outpoint, self.remove(outpoint)))
+
+            for (i, txOut) in enumerate(tx.outputs):
+                self.add((txHash, i), txOut)
+
+        return undo
+
+
+    def disconnectBlock(self, block, undo):
+        """revert connectBlock using its undo record"""
+        self._revert(block.transactions, list(undo))
+
+
+    def _revert(self, transactions, undo):
+        for tx in reversed(transactions):
+            txHash = tx.toHash()
+
+            for i in range(len(tx.outputs)):
+                self.remove((txHash, i))
+
+            for _ in tx.inputs:
+                (outpoint, txOut) = undo.pop()
+                self.add(outpoint, txOut)
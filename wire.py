@@ -0,0 +1,246 @@
+# Binary wire format for transactions and blocks.
+#
+# Every top level message starts with a version byte, counts and variable
+# sized fields are prefixed with a compact size integer (as in bitcoin) and
+# each tx inside a block is length prefixed so it can be skipped without
+# being parsed. Parsing works on a memoryview and only copies the fields
+# that become attributes (hashes, keys).
+
+from base58check import decode, encodePayload
+from block import Block, BlockHeader
+from tx import Tx, TxIn, TxOut, TxReward
+
+WIRE_VERSION = 1
+
+TX_TYPE = 0
+TX_REWARD_TYPE = 1
+
+ADDRESS_PAYLOAD_SIZE = 21
+
+# previous block hash, merkle root and nonce
+BLOCK_HEADER_SIZE = 32 + 32 + 4
+
+
+# compact size integers
+
+def encodeVarInt(n):
+    if n < 0xfd:
+        return bytes((n,))
+    if n <= 0xffff:
+        return b'\xfd' + n.to_bytes(2, 'little')
+    if n <= 0xffffffff:
+        return b'\xfe' + n.to_bytes(4, 'little')
+    return b'\xff' + n.to_bytes(8, 'little')
+
+
+def _take(view, offset, size):
+    end = offset + size
+    if end > len(view):
+        raise ValueError("Truncated message, expected {} more byte(s).".format(end - len(view)))
+    return (view[offset:end], end)
+
+
+def readVarInt(view, offset):
+    (prefix, offset) = _take(view, offset, 1)
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}.get(prefix[0])
+
+    if size is None:
+        return (prefix[0], offset)
+
+    (data, offset) = _take(view, offset, size)
+    return (int.from_bytes(data, 'little'), offset)
+
+
+def readInt(view, offset, size):
+    (data, offset) = _take(view, offset, size)
+    return (int.from_bytes(data, 'big'), offset)
+
+
+def readBytes(view, offset, size):
+    (data, offset) = _take(view, offset, size)
+    return (bytes(data), offset)
+
+
+# writers, each appends to a bytearray
+
+def writeTxIn(out, txIn):
+    out += txIn.prevTxHash
+    out += txIn.prevTxOutIndex.to_bytes(4, 'big')
+
+    if txIn.signature is None:
+        out += b'\x00'
+        return
+
+    (sigFactor, r) = txIn.signature
+    out += b'\x01'
+    out += sigFactor.to_bytes(32, 'big')
+    out += r.to_bytes(32, 'big')
+    out += encodeVarInt(len(txIn.publicKey))
+    out += txIn.publicKey
+
+
+def writeTxOut(out, txOut):
+    out += txOut.amount.to_bytes(8, 'big')
+    out += decode(txOut.address) # version + hash160 instead of the base58 string
+
+
+def writeTx(out, tx):
+    if isinstance(tx, TxReward):
+        out += bytes((TX_REWARD_TYPE,))
+        out += encodeVarInt(tx.blockHeight)
+        out += encodeVarInt(tx.extraNonce)
+        out += decode(tx.outputs[0].address)
+        return
+
+    out += bytes((TX_TYPE,))
+    out += encodeVarInt(len(tx.inputs))
+    for txIn in tx.inputs:
+        writeTxIn(out, txIn)
+
+    out += encodeVarInt(len(tx.outputs))
+    for txOut in tx.outputs:
+        writeTxOut(out, txOut)
+
+
+def writeBlockHeader(out, blockHeader):
+    out += blockHeader.prevBlockHash
+    out += blockHeader.merkleRoot
+    out += blockHeader.nonce
+
+
+def writeBlock(out, block):
+    writeBlockHeader(out, block.blockHeader)
+
+    out += encodeVarInt(len(block.transactions))
+    for tx in block.transactions:
+        txBytes = bytearray()
+        writeTx(txBytes, tx)
+
+        out += encodeVarInt(len(txBytes))
+        out += txBytes
+
+
+# readers, each takes a memoryview and offset and returns (object, offset)
+
+def readTxIn(view, offset):
+    (prevTxHash, offset) = readBytes(view, offset, 32)
+    (prevTxOutIndex, offset) = readInt(view, offset, 4)
+    txIn = TxIn(prevTxHash, prevTxOutIndex)
+
+    (hasScriptSig, offset) = readInt(view, offset, 1)
+    if hasScriptSig:
+        (sigFactor, offset) = readInt(view, offset, 32)
+        (r, offset) = readInt(view, offset, 32)
+        (keySize, offset) = readVarInt(view, offset)
+        (publicKey, offset) = readBytes(view, offset, keySize)
+        txIn.setScriptSig((sigFactor, r), publicKey)
+
+    return (txIn, offset)
+
+
+def _readAddress(view, offset):
+    (payload, offset) = readBytes(view, offset, ADDRESS_PAYLOAD_SIZE)
+    return (encodePayload(payload), offset)
+
+
+def readTxOut(view, offset):
+    (amount, offset) = readInt(view, offset, 8)
+    (address, offset) = _readAddress(view, offset)
+    return (TxOut(amount, address), offset)
+
+
+def readTx(view, offset):
+    (txType, offset) = readInt(view, offset, 1)
+
+    if txType == TX_REWARD_TYPE:
+        (blockHeight, offset) = readVarInt(view, offset)
+        (extraNonce, offset) = readVarInt(view, offset)
+        (address, offset) = _readAddress(view, offset)
+        return (TxReward(address, blockHeight, extraNonce), offset)
+
+    if txType != TX_TYPE:
+        raise ValueError("Unknown transaction type {}.".format(txType))
+
+    (count, offset) = readVarInt(view, offset)
+    inputs = []
+    for _ in range(count):
+        (txIn, offset) = readTxIn(view, offset)
+        inputs.append(txIn)
+
+    (count, offset) = readVarInt(view, offset)
+    outputs = []
+    for _ in range(count):
+        (txOut, offset) = readTxOut(view, offset)
+        outputs.append(txOut)
+
+    return (Tx(inputs, outputs), offset)
+
+
+def readBlockHeader(view, offset):
+    (prevBlockHash, offset) = readBytes(view, offset, 32)
+    (merkleRoot, offset) = readBytes(view, offset, 32)
+    (nonce, offset) = readBytes(view, offset, 4)
+    return (BlockHeader(prevBlockHash, merkleRoot, nonce), offset)
+
+
+def readBlock(view, offset):
+    (blockHeader, offset) = readBlockHeader(view, offset)
+
+    (count, offset) = readVarInt(view, offset)
+    transactions = []
+    for _ in range(count):
+        (size, offset) = readVarInt(view, offset)
+        (txView, offset) = _take(view, offset, size)
+
+        (tx, used) = readTx(txView, 0)
+        if used != size:
+            raise ValueError("Transaction length prefix does not match its contents.")
+        transactions.append(tx)
+
+    return (Block(transactions, blockHeader), offset)
+
+
+# versioned top level messages
+
+def _encode(writer, obj):
+    out = bytearray((WIRE_VERSION,))
+    writer(out, obj)
+    return bytes(out)
+
+
+def _decode(reader, data):
+    view = memoryview(data)
+
+    (version, offset) = readInt(view, 0, 1)
+    if version != WIRE_VERSION:
+        raise ValueError("Unsupported wire format version {}.".format(version))
+
+    (obj, offset) = reader(view, offset)
+    if offset != len(view):
+        raise ValueError("Unexpected trailing bytes after message.")
+
+    return obj
+
+
+def encodeTx(tx):
+    return _encode(writeTx, tx)
+
+
+def decodeTx(data):
+    return _decode(readTx, data)
+
+
+def encodeBlockHeader(blockHeader):
+    return _encode(writeBlockHeader, blockHeader)
+
+
+def decodeBlockHeader(data):
+    return _decode(readBlockHeader, data)
+
+
+def encodeBlock(block):
+    return _encode(writeBlock, block)
+
+
+def decodeBlock(data):
+    return _decode(readBlock, data)